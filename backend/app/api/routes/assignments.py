@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.db.database import get_db
+from app.core.config import settings
 from app.core.security import get_current_user, get_current_active_teacher
 from app.models.user import User
 from app.models.assignment import Assignment, AssignmentSubmission
@@ -263,9 +264,9 @@ async def submit_assignment(
     db.commit()
     db.refresh(submission)
     
-    # Trigger AI auto-grading if enabled
+    # Trigger AI auto-grading if enabled; the submission itself is the queue entry
     if assignment.auto_grade:
-        background_tasks.add_task(auto_grade_submission, submission.id)
+        background_tasks.add_task(enqueue_auto_grading)
     
     return submission
 
@@ -326,6 +327,9 @@ async def grade_submission(
     submission.grade_percentage = (grade_data.score / submission.max_score) * 100
     submission.teacher_feedback = grade_data.feedback
     submission.is_graded = True
+    if (submission.ai_feedback or {}).get("status") == "claimed":
+        # Release the auto-grading claim; the worker's result is discarded
+        submission.ai_feedback = None
     
     from sqlalchemy.sql import func
     submission.graded_at = func.now()
@@ -334,9 +338,15 @@ async def grade_submission(
     
     return {"message": "Assignment graded successfully"}
 
-async def auto_grade_submission(submission_id: int):
-    """Background task for AI auto-grading"""
-    # This would integrate with the RAG service for AI grading
-    # Implementation depends on the specific AI grading logic
-    logger.info(f"Auto-grading submission {submission_id}")
-    pass
+def enqueue_auto_grading():
+    """Wake a grading worker (runs after the response is sent)"""
+    if settings.GRADING_BACKEND == "local":
+        from app.services.grading_service import GradingService
+        GradingService().grade_pending()
+        return
+    try:
+        from app.worker import grade_pending_submissions
+        grade_pending_submissions.delay()
+    except Exception as e:
+        # The submission stays pending and is picked up by the periodic sweep
+        logger.warning(f"Could not enqueue auto-grading: {str(e)}")
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.db.database import get_db
+from app.db.database import get_db, SessionLocal
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.analytics import ChatMessage
-from app.services.rag_service import RAGService
-from app.schemas.rag import ChatRequest, ChatResponse, DocumentUpload
+from app.core.config import settings
+from app.services.llm_gateway import LLMUnavailable
+from app.services.rag_service import get_rag_service
+from app.services.summary_cache import get_cached_summary, store_summary, summary_key
+from app.services.ingestion import JOB_ID_PATTERN, IngestionJob, create_upload_job, run_job
+from app.schemas.rag import ChatRequest, ChatResponse, DocumentUpload, IngestionJobStatus
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,14 +21,12 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Initialize RAG service
-rag_service = RAGService()
+rag_service = get_rag_service()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_ai(
     chat_request: ChatRequest,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Chat with AI assistant for Japanese learning support"""
     try:
@@ -37,37 +42,18 @@ async def chat_with_ai(
             query=chat_request.message,
             user_context=user_context,
             course_id=chat_request.course_id,
-            conversation_history=chat_request.conversation_history
+            conversation_history=chat_request.conversation_history,
+            session_id=history_session_key(current_user.id, chat_request.session_id)
         )
         
-        # Save chat message to database
-        chat_message = ChatMessage(
-            user_id=current_user.id,
-            course_id=chat_request.course_id,
-            message=chat_request.message,
-            response=response_data["response"],
-            message_type=chat_request.message_type,
-            context_data=response_data.get("context"),
-            source_documents=response_data.get("sources"),
-            confidence_score=response_data.get("confidence"),
-            grammar_topic=response_data.get("grammar_topic"),
-            vocabulary_topic=response_data.get("vocabulary_topic"),
-            jlpt_level=response_data.get("jlpt_level")
-        )
-        
-        db.add(chat_message)
-        db.commit()
-        
-        # Update user analytics in background
-        background_tasks.add_task(
-            rag_service.update_user_analytics,
-            current_user.id,
-            chat_request.message_type,
-            response_data
+        # Save chat message to database (off the event loop)
+        message_id = await run_in_threadpool(
+            save_chat_message, current_user.id, chat_request, response_data
         )
         
         return ChatResponse(
-            message_id=chat_message.id,
+            message_id=message_id,
+            session_id=chat_request.session_id,
             response=response_data["response"],
             sources=response_data.get("sources", []),
             confidence=response_data.get("confidence", 0.0),
@@ -83,6 +69,69 @@ async def chat_with_ai(
             detail="Failed to generate AI response"
         )
 
+@router.post("/chat/stream")
+async def stream_chat_with_ai(
+    chat_request: ChatRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Chat with AI assistant, streaming the answer as Server-Sent Events"""
+    user_context = {
+        "jlpt_level": current_user.jlpt_level,
+        "learning_preferences": current_user.learning_preferences,
+        "role": current_user.role.value
+    }
+    user_id = current_user.id
+
+    async def event_stream():
+        try:
+            async for event, data in rag_service.stream_response(
+                query=chat_request.message,
+                user_context=user_context,
+                course_id=chat_request.course_id,
+                conversation_history=chat_request.conversation_history,
+                session_id=history_session_key(user_id, chat_request.session_id)
+            ):
+                if event == "done":
+                    message_id = await run_in_threadpool(save_chat_message, user_id, chat_request, data)
+                    data = {"message_id": message_id, "cached": data.get("cached", False)}
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Error in streaming chat endpoint: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Failed to generate AI response'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def history_session_key(user_id: int, session_id: Optional[str]) -> Optional[str]:
+    """Scope client session ids to the user so sessions cannot be read across accounts"""
+    return f"{user_id}:{session_id}" if session_id else None
+
+def save_chat_message(user_id: int, chat_request: ChatRequest, response_data: dict) -> int:
+    """Persist a completed chat exchange (blocking; call via run_in_threadpool)"""
+    db = SessionLocal()
+    try:
+        chat_message = ChatMessage(
+            user_id=user_id,
+            course_id=chat_request.course_id,
+            message=chat_request.message,
+            response=response_data["response"],
+            message_type=chat_request.message_type,
+            context_data=response_data.get("context"),
+            source_documents=response_data.get("sources"),
+            confidence_score=response_data.get("confidence"),
+            grammar_topic=response_data.get("grammar_topic"),
+            vocabulary_topic=response_data.get("vocabulary_topic"),
+            jlpt_level=response_data.get("jlpt_level")
+        )
+        db.add(chat_message)
+        db.commit()
+        return chat_message.id
+    finally:
+        db.close()
+
 @router.post("/feedback")
 async def provide_chat_feedback(
     message_id: int,
@@ -143,7 +192,7 @@ async def get_conversation_history(
 async def generate_ai_quiz(
     topic: str,
     difficulty: str = "medium",
-    num_questions: int = 10,
+    num_questions: int = Query(10, ge=1, le=settings.QUIZ_MAX_QUESTIONS),
     question_types: List[str] = ["multiple_choice"],
     jlpt_level: Optional[str] = None,
     current_user: User = Depends(get_current_user)
@@ -173,6 +222,42 @@ async def generate_ai_quiz(
             detail="Failed to generate quiz"
         )
 
+@router.post("/generate-quiz/stream")
+async def stream_ai_quiz(
+    topic: str,
+    difficulty: str = "medium",
+    num_questions: int = Query(10, ge=1, le=settings.QUIZ_MAX_QUESTIONS),
+    question_types: List[str] = ["multiple_choice"],
+    jlpt_level: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Generate AI-powered quiz questions, streaming each question as a Server-Sent Event"""
+    if current_user.role.value != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only teachers can generate quizzes"
+        )
+
+    async def event_stream():
+        try:
+            async for event, data in rag_service.stream_quiz(
+                topic=topic,
+                difficulty=difficulty,
+                num_questions=num_questions,
+                question_types=question_types,
+                jlpt_level=jlpt_level or current_user.jlpt_level
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Error in streaming quiz endpoint: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Failed to generate quiz'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/generate-lesson-summary")
 async def generate_lesson_summary(
     lesson_content: str,
@@ -187,14 +272,27 @@ async def generate_lesson_summary(
         )
     
     try:
+        key = summary_key(lesson_content, target_level, current_user.jlpt_level)
+        cached = await run_in_threadpool(get_cached_summary, key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
         summary_data = await rag_service.generate_lesson_summary(
             content=lesson_content,
             target_level=target_level,
             jlpt_level=current_user.jlpt_level
         )
+        await run_in_threadpool(store_summary, key, summary_data)
         
         return summary_data
         
+    except LLMUnavailable as e:
+        logger.warning(f"Lesson summary deferred, LLM unavailable: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The AI service is busy, please try again shortly",
+            headers={"Retry-After": "30"}
+        )
     except Exception as e:
         logger.error(f"Error generating lesson summary: {str(e)}")
         raise HTTPException(
@@ -202,37 +300,81 @@ async def generate_lesson_summary(
             detail="Failed to generate lesson summary"
         )
 
-@router.post("/upload-documents")
+@router.post("/upload-documents", response_model=IngestionJobStatus, status_code=status.HTTP_202_ACCEPTED)
 async def upload_documents(
+    course_id: int,
     documents: List[DocumentUpload],
-    current_user: User = Depends(get_current_user)
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
-    """Upload and process documents for RAG system"""
+    """Queue documents for ingestion into a course's RAG material; poll the returned job for progress"""
     if current_user.role.value != "teacher":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only teachers can upload documents"
         )
     
+    # Check if teacher owns the course
+    from app.models.course import Course
+    course = db.query(Course).filter(Course.id == course_id).first()
+    
+    if not course or course.teacher_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to upload documents for this course"
+        )
+    
     try:
-        results = []
-        for doc in documents:
-            result = await rag_service.process_document(
-                content=doc.content,
-                filename=doc.filename,
-                document_type=doc.document_type,
-                metadata=doc.metadata
-            )
-            results.append(result)
-        
-        return {"processed_documents": results}
+        job = await run_in_threadpool(
+            create_upload_job, [doc.dict() for doc in documents], course_id, None, current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    try:
+        if settings.INGESTION_BACKEND == "local":
+            background_tasks.add_task(run_job, job)
+        else:
+            from app.worker import run_ingestion_job
+            await run_in_threadpool(run_ingestion_job.delay, job.job_id)
+        return job.progress()
         
     except Exception as e:
         logger.error(f"Error uploading documents: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to process documents"
+            detail="Failed to queue documents"
+        )
+
+def can_view_job(job: IngestionJob, user: User, db: Session) -> bool:
+    """Upload jobs are visible to their uploader and the course teacher; other jobs to admins"""
+    owner = job.owner
+    if owner is None:
+        return user.role.value == "admin"
+    if owner.get("user_id") == user.id:
+        return True
+    from app.models.course import Course
+    course = db.query(Course).filter(Course.id == owner.get("course_id")).first()
+    return course is not None and course.teacher_id == user.id
+
+@router.get("/upload-documents/{job_id}", response_model=IngestionJobStatus)
+async def get_upload_progress(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a document ingestion job (its uploader or the course teacher only)"""
+    job = IngestionJob(job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None or not job.exists() or not can_view_job(job, current_user, db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingestion job not found"
         )
+    return job.progress()
 
 @router.get("/system-status")
 async def get_rag_system_status():
@@ -27,11 +27,93 @@ class Settings(BaseSettings):
     # RAG System
     EMBEDDING_MODEL: str = "intfloat/multilingual-e5-small"
     LLM_MODEL: str = "gpt-3.5-turbo"  # fallback to local models if no API key
-    HF_MODEL_NAME: str = "microsoft/DialoGPT-medium"
+    HF_MODEL_NAME: str = os.getenv("HF_MODEL_NAME", "Qwen/Qwen2.5-0.5B-Instruct")  # local backend; needs a chat template
     EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
     CHUNK_SIZE: int = 512
     CHUNK_OVERLAP: int = 50
-    TOP_K_RETRIEVAL: int = 5
+    TOP_K_RETRIEVAL: int = 3
+    HYBRID_RETRIEVAL_ENABLED: bool = True  # BM25 (character bigrams) + dense, fused by RRF
+    HYBRID_CANDIDATES: int = 10  # candidates taken from each side before fusion
+    RRF_K: int = 60
+    RERANK_ENABLED: bool = False
+    RERANKER_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    RERANK_CANDIDATES: int = 12  # retrieved before re-ranking down to TOP_K_RETRIEVAL
+    RERANK_BATCH_SIZE: int = 8
+    RERANK_BUDGET_MS: int = 150  # stop scoring further batches after this
+    CONTEXT_TOKEN_BUDGET: int = 1200  # retrieved context per prompt
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8  # bigram overlap above which a passage is a duplicate
+    RAG_FILTER_BY_JLPT: bool = False  # also restrict retrieval to material at/below the learner's level
+    
+    # RAG Engine
+    HF_TOKEN: Optional[str] = os.getenv("HF_TOKEN")
+    GOOGLE_API_KEY: Optional[str] = os.getenv("GOOGLE_API_KEY")
+    RAG_EMBEDDING_MODEL: str = "Mohamed-Gamil/multilingual-e5-small-JapaneseTeacher"
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "gemini")  # gemini | local | stub
+    GEMINI_MODEL: str = "gemini-2.5-flash-lite"
+    LLM_MAX_TOKENS: int = 512
+    LOCAL_LLM_MAX_BATCH: int = 4  # concurrent requests decoded together
+    LOCAL_LLM_BATCH_WAIT_MS: int = 25  # how long a batch waits to fill up
+    LOCAL_LLM_THREADS: int = 0  # torch CPU threads, 0 = torch default
+    LLM_STUB_LATENCY_MS: int = 0
+    LLM_MAX_CONCURRENCY: int = 8  # in-flight LLM calls per process
+    LLM_QUEUE_MAX: int = 200  # waiting calls beyond this get the fallback answer at once
+    LLM_QUEUE_TIMEOUT: float = 20.0  # seconds a call may wait for a slot
+    LLM_MAX_RETRIES: int = 3  # retries after rate-limit errors
+    LLM_BACKOFF_BASE: float = 0.5  # seconds, doubled per retry
+    LLM_BREAKER_THRESHOLD: int = 5  # consecutive failures that open the circuit
+    LLM_BREAKER_COOLDOWN: float = 30.0  # seconds before a trial call
+    CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "test3")  # vector store dir, any backend
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "chroma")  # chroma | faiss
+    FAISS_INDEX_TYPE: str = "hnsw"  # hnsw | flat
+    FAISS_HNSW_M: int = 32
+    FAISS_MMAP: bool = True  # memory-map the index read-only at startup (faiss >= 1.11)
+    FAISS_COMPACT_TOMBSTONE_RATIO: float = 0.2  # rebuild the HNSW index once this share of it is deleted vectors
+    RAG_WARMUP_ON_STARTUP: bool = False
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_WORKERS: int = 2  # threads reserved for query embedding + vector search
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "data/cache/embeddings.sqlite3")
+    QUERY_CACHE_SIZE: int = 2048
+    QUERY_CACHE_TTL: int = 3600  # seconds, Redis tier only
+    QUERY_CACHE_USE_REDIS: bool = False
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # cosine similarity
+    SEMANTIC_CACHE_TTL: int = 86400  # seconds
+    SEMANTIC_CACHE_SIZE: int = 1000
+    CHAT_HISTORY_MAX_TURNS: int = 6  # exchanges kept verbatim per session
+    CHAT_HISTORY_SUMMARIZE_BATCH: int = 4  # older exchanges folded into the summary at once
+    CHAT_HISTORY_TTL: int = 86400  # seconds
+    CHAT_HISTORY_USE_REDIS: bool = False
+    
+    # Quiz bank
+    QUIZ_BANK_PATH: str = os.getenv("QUIZ_BANK_PATH", "data/quiz_bank.sqlite3")
+    QUIZ_BANK_TARGET: int = 30  # questions kept ready per (topic, level, difficulty, type)
+    QUIZ_DEDUP_THRESHOLD: float = 0.92  # cosine similarity above which a question is a duplicate
+    QUIZ_GENERATION_BATCH: int = 3  # questions per LLM call; calls run concurrently
+    QUIZ_TOKENS_PER_QUESTION: int = 160  # reply budget per question (with explanation); caps the batch by LLM_MAX_TOKENS
+    QUIZ_MAX_QUESTIONS: int = 50  # upper bound on questions per quiz request
+    QUIZ_GENERATION_TIMEOUT: float = 30.0  # seconds, then the quiz is returned partial
+    
+    # Lesson summaries
+    SUMMARY_CHUNK_TOKENS: int = 2500  # longer lessons are map-reduced in parts of this size
+    
+    # Auto-grading
+    GRADING_BACKEND: str = os.getenv("GRADING_BACKEND", "celery")  # "celery" | "local" (in-process, for development)
+    GRADING_BATCH_SIZE: int = 8  # submissions claimed and graded concurrently per run
+    GRADING_SWEEP_INTERVAL: float = 60.0  # seconds between periodic sweeps for pending submissions
+    GRADING_CLAIM_TIMEOUT: float = 600.0  # seconds after which a claimed, ungraded submission is pending again
+    
+    # Syllabus ingestion
+    WASABI_SYLLABUS_URL: str = "https://wasabi-jpn.com/magazine/japanese-grammar/wasabis-online-japanese-grammar-reference/?lang=en"
+    INGESTION_WORK_DIR: str = os.getenv("INGESTION_WORK_DIR", "data/ingestion")  # per-job checkpoints and artefacts
+    INGESTION_BACKEND: str = os.getenv("INGESTION_BACKEND", "celery")  # "celery" | "local" (in-process, for development)
+    SYLLABUS_MAX_LESSONS: int = 40
+    CRAWL_CACHE_DIR: str = os.getenv("CRAWL_CACHE_DIR", "data/cache/html")
+    CRAWL_CONCURRENCY: int = 4
+    CRAWL_MIN_INTERVAL: float = 0.5  # seconds between requests to the same host
+    CRAWL_TIMEOUT: float = 30.0
+    DOCLING_MAX_WORKERS: int = 2  # concurrent conversions; each loads its own docling models (GBs of RAM)
+    DOCLING_TIMEOUT: int = 600  # seconds per document
+    DOCLING_RETRIES: int = 2
     
     # Redis (for caching and sessions)
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
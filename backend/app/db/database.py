@@ -34,6 +34,7 @@ def get_db() -> Session:
 
 def init_db():
     """Initialize database tables"""
+    import app.models.lesson_summary  # noqa: F401  registers the lesson_summaries table
     try:
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Integer, JSON, String
+from sqlalchemy.sql import func
+
+from app.db.database import Base
+
+
+class LessonSummary(Base):
+    """Generated lesson summary, addressed by the hash of its inputs."""
+    __tablename__ = "lesson_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    content_hash = Column(String(64), index=True, nullable=False)
+    target_level = Column(String(50), nullable=False)
+    jlpt_level = Column(String(10))
+    prompt_version = Column(String(20), nullable=False)
+    llm_model = Column(String(200))
+    summary = Column(JSON, nullable=False)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
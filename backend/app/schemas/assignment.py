@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -89,6 +89,14 @@ class AssignmentSubmissionResponse(BaseModel):
     submitted_at: datetime
     graded_at: Optional[datetime] = None
 
+    @field_validator("ai_feedback")
+    @classmethod
+    def hide_grading_claim(cls, value):
+        # The auto-grading worker's claim token is internal bookkeeping
+        if value and "claim" in value:
+            value = {k: v for k, v in value.items() if k != "claim"}
+        return value
+
     class Config:
         from_attributes = True
 
@@ -6,10 +6,12 @@ class ChatRequest(BaseModel):
     message: str
     course_id: Optional[int] = None
     message_type: str = "question"  # question, explanation, practice, etc.
+    session_id: Optional[str] = None  # server-side history; preferred over conversation_history
     conversation_history: Optional[List[Dict[str, Any]]] = []
 
 class ChatResponse(BaseModel):
     message_id: int
+    session_id: Optional[str] = None
     response: str
     sources: List[Dict[str, Any]] = []
     confidence: float = 0.0
@@ -23,6 +25,13 @@ class DocumentUpload(BaseModel):
     document_type: str  # pdf, text, markdown, etc.
     metadata: Optional[Dict[str, Any]] = {}
 
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    status: str  # created, running, completed, incomplete, failed
+    total: int
+    stages: Dict[str, int] = {}  # sources per stage: pending, parsed, chunked, embedded, indexed
+    errors: Dict[str, str] = {}
+
 class QuizGenerationRequest(BaseModel):
     topic: str
     difficulty: str = "medium"
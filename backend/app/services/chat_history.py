@@ -0,0 +1,169 @@
+"""
+Server-side per-session chat history.
+
+Each session keeps its last ``max_turns`` exchanges verbatim plus a rolling
+summary of everything older, so the history sent to the LLM stays bounded
+however long the conversation runs. Summarization runs in the background,
+never on the request path. Sessions live in memory by default or in Redis
+(same JSON layout) when a client is supplied.
+"""
+import json
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+# A turn is {"query": str, "response": str}
+Turn = Dict[str, str]
+Summarizer = Callable[[str, List[Turn]], str]
+
+
+class InMemoryHistoryBackend:
+    """Sessions in a dict; expired ones are swept on save at most every ``sweep_interval`` seconds."""
+
+    def __init__(self, ttl: int = 86400, sweep_interval: float = 60.0):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sessions: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.time()
+
+    def load(self, session_id: str) -> Dict:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] < time.time():
+                self._sessions.pop(session_id, None)
+                return {"summary": "", "turns": []}
+            return json.loads(json.dumps(entry[1]))
+
+    def save(self, session_id: str, state: Dict):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now + self.ttl, state)
+            if now - self._swept_at >= self.sweep_interval:
+                self._swept_at = now
+                for expired in [key for key, (expires, _) in self._sessions.items() if expires < now]:
+                    del self._sessions[expired]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class RedisHistoryBackend:
+    def __init__(self, client, ttl: int = 86400, prefix: str = "rag:history"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, session_id: str) -> Dict:
+        raw = self.client.get(f"{self.prefix}:{session_id}")
+        return json.loads(raw) if raw else {"summary": "", "turns": []}
+
+    def save(self, session_id: str, state: Dict):
+        self.client.set(f"{self.prefix}:{session_id}", json.dumps(state, ensure_ascii=False), ex=self.ttl)
+
+    def delete(self, session_id: str):
+        self.client.delete(f"{self.prefix}:{session_id}")
+
+
+class ChatHistoryStore:
+    """
+    Bounded session history. Once more than ``max_turns + summarize_batch``
+    turns accumulate, the oldest ones are folded into the summary in one
+    summarizer call on ``executor``, keeping the newest ``max_turns``
+    verbatim. Should the summarizer fall behind by another ``summarize_batch``
+    turns, the overflow is folded by truncation instead.
+    """
+
+    def __init__(self, backend, max_turns: int = 6, summarize_batch: int = 4,
+                 summarizer: Optional[Summarizer] = None, executor: Optional[Executor] = None):
+        self.backend = backend
+        self.max_turns = max_turns
+        self.summarize_batch = summarize_batch
+        self.summarizer = summarizer or truncate_summary
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        # Serialize read-modify-write per session within this process; a lock
+        # disappears as soon as no thread is using it
+        self._locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._locks_guard = threading.Lock()
+        self._summarizing = set()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.Lock()
+            return lock
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        state = self.backend.load(session_id)
+        messages: List[BaseMessage] = []
+        if state["summary"]:
+            messages.append(SystemMessage(f"Summary of the earlier conversation: {state['summary']}"))
+        for turn in state["turns"]:
+            messages.extend([HumanMessage(turn["query"]), AIMessage(turn["response"])])
+        return messages
+
+    def append(self, session_id: str, query: str, response: str):
+        with self._session_lock(session_id):
+            state = self.backend.load(session_id)
+            state["turns"].append({"query": query, "response": response})
+            if len(state["turns"]) > self.max_turns + 2 * self.summarize_batch:
+                overflow = state["turns"][:-self.max_turns]
+                state["turns"] = state["turns"][-self.max_turns:]
+                state["summary"] = truncate_summary(state["summary"], overflow)
+            self.backend.save(session_id, state)
+            if len(state["turns"]) > self.max_turns + self.summarize_batch:
+                self._schedule_summary(session_id)
+
+    def _schedule_summary(self, session_id: str):
+        with self._locks_guard:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        self.executor.submit(self._summarize, session_id)
+
+    def _summarize(self, session_id: str):
+        """Folds the overflow of one session; the slow summarizer call runs without the session lock."""
+        try:
+            with self._session_lock(session_id):
+                state = self.backend.load(session_id)
+            overflow = state["turns"][:-self.max_turns]
+            if not overflow:
+                return
+            try:
+                summary = self.summarizer(state["summary"], overflow)
+            except Exception as e:
+                logger.warning(f"History summarization failed, truncating instead: {e}")
+                summary = truncate_summary(state["summary"], overflow)
+            with self._session_lock(session_id):
+                current = self.backend.load(session_id)
+                if current["turns"][:len(overflow)] != overflow or current["summary"] != state["summary"]:
+                    return  # cleared or already folded meanwhile
+                current["turns"] = current["turns"][len(overflow):]
+                current["summary"] = summary
+                self.backend.save(session_id, current)
+        except Exception as e:
+            logger.error(f"History summarization for a session failed: {e}")
+        finally:
+            with self._locks_guard:
+                self._summarizing.discard(session_id)
+
+    def clear(self, session_id: str):
+        self.backend.delete(session_id)
+
+
+def truncate_summary(summary: str, turns: List[Turn], max_chars: int = 1500) -> str:
+    """Fallback summarizer: keeps the most recent questions, bounded in length."""
+    parts = ([summary] if summary else []) + [turn["query"] for turn in turns]
+    return " / ".join(parts)[-max_chars:]
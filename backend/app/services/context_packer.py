@@ -0,0 +1,87 @@
+"""
+Token-budget-aware context packing for the Q&A prompt.
+
+Retrieved passages are taken best-first (re-rank score when present,
+otherwise retrieval order), near-duplicates of already packed passages are
+dropped, and passages are added until the token budget is spent. The last
+passage that does not fit is trimmed at a sentence boundary instead of being
+dropped when enough budget remains. Token counts are estimated without a
+tokenizer: one token per CJK character, about four characters per token for
+everything else, which over-estimates slightly for Gemini.
+"""
+import re
+from typing import List, Set
+
+from langchain_core.documents import Document
+
+from app.services.sparse_index import tokenize
+
+SEPARATOR = "\n----------\n"
+MIN_TRIMMED_TOKENS = 40
+
+_CJK_CHAR = re.compile(r"[぀-ヿ㐀-鿿ｦ-ﾟ]")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\.])\s*|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _shingles(text: str) -> Set[str]:
+    return set(tokenize(text))
+
+
+def _is_duplicate(shingles: Set[str], packed: List[Set[str]], threshold: float) -> bool:
+    """Overlap relative to the smaller passage, so contained chunks also count."""
+    for other in packed:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= threshold:
+            return True
+    return False
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    """
+    Longest prefix made of whole sentences that fits in ``max_tokens``,
+    sliced from ``text`` so the whitespace and newlines between sentences
+    are kept.
+    """
+    end = used = 0
+    for match in _SENTENCE_END.finditer(text):
+        used += estimate_tokens(text[end:match.start()])
+        if used > max_tokens:
+            break
+        end = match.start()
+    else:
+        if used + estimate_tokens(text[end:]) <= max_tokens:
+            end = len(text)
+    return text[:end].strip()
+
+
+def pack_context(docs: List[Document], max_tokens: int, dedup_threshold: float = 0.8) -> str:
+    ranked = sorted(
+        enumerate(docs),
+        key=lambda item: (-item[1].metadata.get("rerank_score", 0.0), item[0]),
+    )
+    parts, packed_shingles = [], []
+    remaining = max_tokens
+    separator_cost = estimate_tokens(SEPARATOR)
+    for _, doc in ranked:
+        text = doc.page_content.strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if _is_duplicate(shingles, packed_shingles, dedup_threshold):
+            continue
+        cost = estimate_tokens(text) + (separator_cost if parts else 0)
+        if cost > remaining:
+            if remaining >= MIN_TRIMMED_TOKENS:
+                text = _trim(text, remaining - (separator_cost if parts else 0))
+                if text:
+                    parts.append(text)
+            break
+        parts.append(text)
+        packed_shingles.append(shingles)
+        remaining -= cost
+    return SEPARATOR.join(parts)
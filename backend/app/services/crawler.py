@@ -0,0 +1,157 @@
+"""
+Syllabus crawler.
+
+Fetches pages through one pooled HTTP client, several at a time but no more
+often per host than the politeness interval allows. Raw HTML is stored in a
+local cache together with the ETag / Last-Modified validators, which are sent
+back as conditional request headers so unchanged pages cost a 304 and no
+re-processing. Pages fetched for ingestion keep their new validators pending
+until ``confirm_validators`` is called after they were indexed, so a page
+whose processing failed is fetched in full again next time. Base URLs are
+plain arguments, so the crawler can be pointed at a local fixture server.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CrawlResult:
+    url: str
+    html: str
+    path: str  # cached HTML file, usable as a local conversion input
+    changed: bool  # False when the server answered 304 Not Modified
+
+
+def cache_paths(cache_dir: str, url: str):
+    """(HTML path, validator metadata path) of ``url`` in the crawl cache."""
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, f"{key}.html"), os.path.join(cache_dir, f"{key}.json")
+
+
+def _write_meta(meta_path: str, meta: Dict):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def confirm_validators(cache_dir: str, url: str):
+    """Promotes the pending validators of ``url`` once its cached copy has been processed."""
+    _, meta_path = cache_paths(cache_dir, url)
+    if not os.path.exists(meta_path):
+        return
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    pending = meta.pop("pending", None)
+    if pending is not None:
+        meta.update(pending)
+        _write_meta(meta_path, meta)
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least ``min_interval`` seconds apart."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SyllabusCrawler:
+    def __init__(self, cache_dir: str, max_concurrency: int = 4, min_interval: float = 0.5,
+                 timeout: float = 30.0, user_agent: str = "EduAssistant-Crawler/1.0",
+                 client: Optional[httpx.Client] = None):
+        self.cache_dir = cache_dir
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = HostRateLimiter(min_interval)
+        self.client = client or httpx.Client(
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": user_agent},
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, url: str, defer_validators: bool = False) -> CrawlResult:
+        """
+        Fetches ``url`` conditionally. With ``defer_validators`` the validators
+        of a changed page are only used once confirm_validators() is called.
+        """
+        html_path, meta_path = cache_paths(self.cache_dir, url)
+        meta = {}
+        if os.path.exists(meta_path) and os.path.exists(html_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        self.rate_limiter.wait(urlparse(url).netloc)
+        response = self.client.get(url, headers=headers)
+
+        if response.status_code == 304:
+            with open(html_path, "r", encoding="utf-8") as f:
+                return CrawlResult(url, f.read(), html_path, changed=False)
+
+        response.raise_for_status()
+        html = response.text
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if defer_validators:
+            meta = {"etag": meta.get("etag"), "last_modified": meta.get("last_modified"), "pending": validators}
+        else:
+            meta = validators
+        _write_meta(meta_path, {"url": url, **meta, "fetched_at": time.time()})
+        return CrawlResult(url, html, html_path, changed=True)
+
+    def fetch_many(self, urls: List[str], defer_validators: bool = False) -> Dict[str, CrawlResult]:
+        """
+        Fetches pages concurrently. Failed pages are logged and left out.
+        """
+        results = {}
+
+        def fetch_one(url):
+            try:
+                results[url] = self.fetch(url, defer_validators)
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to fetch {url}: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="crawler") as pool:
+            list(pool.map(fetch_one, urls))
+        return results
@@ -0,0 +1,122 @@
+"""
+Batched embedding stage with a persistent on-disk cache.
+
+CachedEmbeddings wraps any LangChain Embeddings model. Document texts are
+normalized and looked up in a SQLite cache keyed by (model name, text hash);
+only misses are sent to the model, in batches of a configurable size, and the
+resulting vectors are written back. Throughput of the last run is logged and
+kept in ``stats``.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalizes and collapses whitespace so trivial edits still hit the cache."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed map of cache key -> float32 vector."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper adding explicit batching and the persistent cache."""
+
+    def __init__(self, base: Embeddings, model_name: str, cache: EmbeddingCache, batch_size: int = 64,
+                 query_cache=None):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        # Optional in-memory/Redis cache for query embeddings (see query_cache)
+        self.query_cache = query_cache
+        self.stats = {"documents": 0, "cache_hits": 0, "embedded": 0, "chunks_per_sec": 0.0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        keys = [text_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        missing_keys = list(missing)
+        for offset in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[offset:offset + self.batch_size]
+            batch_vectors = self.base.embed_documents([missing[key] for key in batch_keys])
+            computed = dict(zip(batch_keys, batch_vectors))
+            self.cache.put_many(computed)
+            vectors.update(computed)
+
+        elapsed = time.perf_counter() - start
+        rate = len(texts) / elapsed if elapsed > 0 else 0.0
+        self.stats["documents"] += len(texts)
+        self.stats["cache_hits"] += len(texts) - len(missing)
+        self.stats["embedded"] += len(missing)
+        self.stats["chunks_per_sec"] = round(rate, 1)
+        if texts:
+            logger.info(
+                f"Embedded {len(texts)} chunks ({len(missing)} computed, "
+                f"{len(texts) - len(missing)} cached) at {rate:.1f} chunks/sec"
+            )
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.base.embed_query(text)
+        key = text_key(self.model_name, text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.base.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
@@ -0,0 +1,256 @@
+"""
+AI auto-grading of assignment submissions.
+
+The database is the durable queue: a submission of an ``auto_grade``
+assignment is pending until it has ``ai_feedback``. A grading run claims a
+batch of pending submissions in a short transaction (``SELECT ... FOR UPDATE
+SKIP LOCKED``, then ``ai_feedback`` is set to a ``claimed`` status with
+``claimed_at`` and committed), so several workers drain the queue side by
+side without holding locks or a transaction open during the LLM calls. The
+batch is graded concurrently through the LLM gateway against the
+assignment's rubric, target grammar and target vocabulary, and score,
+feedback, strengths and weaknesses are written in a second short
+transaction. Claims older than GRADING_CLAIM_TIMEOUT (a worker died
+mid-batch) are pending again. Runs are triggered by the Celery worker
+(app.worker) when a submission arrives and by a periodic sweep; nothing
+runs in the API process.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import func
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.assignment import Assignment, AssignmentSubmission
+from app.services.llm_gateway import LLMUnavailable
+from app.services.rag_service import format_docs, get_rag_service
+from app.services.vector_store import partition_filter
+
+logger = logging.getLogger(__name__)
+
+GRADING_PROMPT_VERSION = "1"
+
+grading_system_prompt = """
+You are a Japanese language teacher grading a student's assignment.
+Grade against the rubric and check the use of the target grammar and
+vocabulary. Be specific and encouraging. Reply with a JSON object only:
+{{"score": number between 0 and {max_points}, "feedback": "overall feedback",
+"rubric": {{"criterion": "comment"}}, "strengths": ["..."], "weaknesses": ["..."]}}
+"""
+
+grading_template = '\n'.join([
+    "### Assignment: {title}",
+    "{instructions}",
+    "",
+    "### Rubric:",
+    "{rubric}",
+    "",
+    "### Target grammar: {target_grammar}",
+    "### Target vocabulary: {target_vocabulary}",
+    "### JLPT level: {jlpt_level}",
+    "",
+    "### Grammar reference:",
+    "{context}",
+    "",
+    "### Student submission:",
+    "{submission}",
+])
+
+
+def parse_grading(text: str, max_points: float) -> Dict[str, Any]:
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in grading reply")
+    data = json.loads(text[start:end + 1])
+    score = min(max(float(data["score"]), 0.0), float(max_points))
+    return {
+        "score": score,
+        "feedback": str(data.get("feedback", "")),
+        "rubric": data.get("rubric") or {},
+        "strengths": [str(s) for s in data.get("strengths") or []],
+        "weaknesses": [str(w) for w in data.get("weaknesses") or []],
+    }
+
+
+class GradingService:
+    def __init__(self, rag_service=None):
+        self.rag_service = rag_service or get_rag_service()
+
+    @staticmethod
+    def _grading_input(assignment: Assignment, submission: AssignmentSubmission) -> Dict[str, Any]:
+        """Plain values, so grading does not touch the ORM session."""
+        return {
+            "submission_id": submission.id,
+            "title": assignment.title,
+            "instructions": assignment.instructions or assignment.description or "",
+            "rubric": json.dumps(assignment.rubric or {}, ensure_ascii=False),
+            "target_grammar": ", ".join(assignment.target_grammar or []) or "(none)",
+            "target_vocabulary": ", ".join(assignment.target_vocabulary or []) or "(none)",
+            "jlpt_level": assignment.jlpt_level or "any",
+            "max_points": submission.max_score or assignment.max_points,
+            "submission": submission.content,
+        }
+
+    async def _reference(self, grammar_points: List[str], jlpt_level: Optional[str]) -> str:
+        if not grammar_points:
+            return "(none)"
+        retrieval_filter = partition_filter(None, jlpt_level, by_jlpt=settings.RAG_FILTER_BY_JLPT)
+        retriever = await asyncio.to_thread(
+            self.rag_service.get_retriever, settings.TOP_K_RETRIEVAL, retrieval_filter
+        )
+        return format_docs(await retriever.ainvoke(" ".join(grammar_points)))
+
+    async def grade(self, item: Dict[str, Any], grammar_points: List[str]) -> Dict[str, Any]:
+        prompt = ChatPromptTemplate([("system", grading_system_prompt), ("user", grading_template)])
+        chain = prompt | self.rag_service.llm | StrOutputParser()
+        context = await self._reference(grammar_points, item["jlpt_level"])
+        reply = await chain.ainvoke({**item, "context": context})
+        return parse_grading(reply, item["max_points"])
+
+    async def _grade_all(self, items, grammar):
+        return await asyncio.gather(
+            *(self.grade(item, grammar[item["submission_id"]]) for item in items),
+            return_exceptions=True,
+        )
+
+    @staticmethod
+    def _claim(batch_size: int, token: str):
+        """
+        Marks up to ``batch_size`` pending submissions (or claims older than
+        GRADING_CLAIM_TIMEOUT, whose worker died) as claimed by ``token`` and
+        commits, so no row lock or transaction is held while grading.
+        Returns the plain grading inputs and the grammar points per submission.
+        """
+        stale_before = (datetime.now(timezone.utc) - timedelta(seconds=settings.GRADING_CLAIM_TIMEOUT)).isoformat()
+        db = SessionLocal()
+        try:
+            submissions = db.query(AssignmentSubmission).join(
+                Assignment, Assignment.id == AssignmentSubmission.assignment_id
+            ).filter(
+                Assignment.auto_grade == True,
+                AssignmentSubmission.is_graded == False,
+                or_(
+                    AssignmentSubmission.ai_feedback.is_(None),
+                    and_(
+                        AssignmentSubmission.ai_feedback["status"].as_string() == "claimed",
+                        AssignmentSubmission.ai_feedback["claimed_at"].as_string() < stale_before,
+                    ),
+                )
+            ).order_by(AssignmentSubmission.submitted_at).limit(batch_size).with_for_update(
+                skip_locked=True, of=AssignmentSubmission
+            ).all()
+            if not submissions:
+                return [], {}
+
+            assignments = {
+                a.id: a for a in db.query(Assignment).filter(
+                    Assignment.id.in_({s.assignment_id for s in submissions})
+                ).all()
+            }
+            items = [GradingService._grading_input(assignments[s.assignment_id], s) for s in submissions]
+            grammar = {s.id: assignments[s.assignment_id].target_grammar or [] for s in submissions}
+            claimed_at = datetime.now(timezone.utc).isoformat()
+            for submission in submissions:
+                submission.ai_feedback = {"status": "claimed", "claim": token, "claimed_at": claimed_at}
+            db.commit()
+            return items, grammar
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _record(items, results, token: str) -> Dict[str, int]:
+        """
+        Writes the grades in one short transaction. Rows whose claim is no
+        longer ours (swept as stale and reclaimed) or that a teacher graded
+        meanwhile are left alone; deferred rows are released so the next run
+        picks them up.
+        """
+        counts = {"graded": 0, "failed": 0, "deferred": 0, "lost": 0}
+        db = SessionLocal()
+        try:
+            submissions = {
+                s.id: s for s in db.query(AssignmentSubmission).filter(
+                    AssignmentSubmission.id.in_([item["submission_id"] for item in items])
+                ).with_for_update().all()
+            }
+            for item, result in zip(items, results):
+                submission = submissions.get(item["submission_id"])
+                if (submission is None or submission.is_graded
+                        or (submission.ai_feedback or {}).get("claim") != token):
+                    counts["lost"] += 1
+                    continue
+                if isinstance(result, LLMUnavailable):
+                    submission.ai_feedback = None
+                    counts["deferred"] += 1
+                    continue
+                if isinstance(result, Exception):
+                    logger.error(f"Auto-grading submission {submission.id} failed: {result}")
+                    submission.ai_feedback = {"status": "failed", "error": str(result),
+                                              "prompt_version": GRADING_PROMPT_VERSION}
+                    counts["failed"] += 1
+                    continue
+                submission.score = result["score"]
+                submission.grade_percentage = (result["score"] / submission.max_score) * 100 if submission.max_score else None
+                submission.ai_feedback = {
+                    "status": "graded",
+                    "feedback": result["feedback"],
+                    "rubric": result["rubric"],
+                    "prompt_version": GRADING_PROMPT_VERSION,
+                }
+                submission.strengths = result["strengths"]
+                submission.weaknesses = result["weaknesses"]
+                submission.is_graded = True
+                submission.graded_at = func.now()
+                counts["graded"] += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return counts
+
+    def grade_pending(self, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Claims and grades one batch of pending submissions. Submissions the LLM
+        cannot take right now are released back to pending; unparseable grades
+        are recorded as failed so a teacher grades them by hand. Returns run
+        statistics.
+        """
+        batch_size = batch_size or settings.GRADING_BATCH_SIZE
+        start = time.perf_counter()
+        token = uuid.uuid4().hex
+        items, grammar = self._claim(batch_size, token)
+        if not items:
+            return {"claimed": 0, "graded": 0, "failed": 0, "deferred": 0}
+
+        results = asyncio.run(self._grade_all(items, grammar))
+        counts = self._record(items, results, token)
+
+        elapsed = time.perf_counter() - start
+        rate = 60 * counts["graded"] / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Auto-graded {counts['graded']}/{len(items)} submissions in {elapsed:.1f}s "
+            f"({rate:.1f}/min, {counts['failed']} failed, {counts['deferred']} deferred, "
+            f"{counts['lost']} reclaimed by another worker)"
+        )
+        return {
+            "claimed": len(items),
+            "graded": counts["graded"],
+            "failed": counts["failed"],
+            "deferred": counts["deferred"],
+            "seconds": round(elapsed, 2),
+            "per_minute": round(rate, 1),
+        }
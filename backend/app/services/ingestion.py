@@ -0,0 +1,349 @@
+"""
+Offline ingestion pipeline.
+
+Corpus building runs here, outside the API process: from the ``ingest.py``
+CLI or from the Celery worker (``app.worker``). A job moves every source
+through four stages,
+
+    parse (docling) -> chunk -> embed (fills the embedding cache) -> index
+
+and checkpoints the stage each source has reached in
+``INGESTION_WORK_DIR/<job_id>/state.json`` after every step, so an
+interrupted job resumes where it stopped instead of starting over.
+"""
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.crawler import confirm_validators
+from app.services.ingestion_manifest import IngestionManifest, content_hash
+from app.services.rag_service import (
+    chunk_document,
+    chunk_tags,
+    get_rag_service,
+    get_syllabus,
+    index_chunks,
+    make_crawler,
+    parse_documents,
+    remove_sources,
+)
+from app.services.vector_store import partition_metadata
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["pending", "parsed", "chunked", "embedded", "indexed"]
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+TEXT_DOCUMENT_TYPES = {"text", "txt", "markdown", "md"}
+
+
+class IngestionJob:
+    """
+    Checkpointed state of one ingestion run. ``sources`` maps a source key
+    (URL or upload name) to its stage, input and intermediate artefacts.
+    """
+
+    def __init__(self, job_id: str, work_dir: Optional[str] = None):
+        self.job_id = job_id
+        self.dir = os.path.join(work_dir or settings.INGESTION_WORK_DIR, job_id)
+        self.state_path = os.path.join(self.dir, "state.json")
+        self._lock = threading.Lock()
+        self.state = {"job_id": job_id, "status": "created", "created_at": time.time(), "sources": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    @classmethod
+    def create(cls, sources: Dict[str, Dict], job_id: Optional[str] = None, work_dir: Optional[str] = None,
+               owner: Optional[Dict] = None):
+        """
+        ``sources``: {key: {"input": url or local path, "metadata": {...}}}.
+        A source that is already Markdown may start at ``"stage": "parsed"``
+        with its ``"markdown"`` path. ``owner`` ({"user_id", "course_id"}) is
+        stored with the job so its progress is only shown to that owner.
+        """
+        job = cls(job_id or uuid.uuid4().hex, work_dir)
+        if owner is not None:
+            job.state["owner"] = owner
+        for key, source in sources.items():
+            job.state["sources"].setdefault(key, {"stage": "pending", "input": key, "metadata": {}, **source})
+        job.save()
+        return job
+
+    def exists(self) -> bool:
+        return os.path.exists(self.state_path)
+
+    @property
+    def owner(self) -> Optional[Dict]:
+        return self.state.get("owner")
+
+    @property
+    def sources(self) -> Dict[str, Dict]:
+        return self.state["sources"]
+
+    def at_stage(self, stage: str) -> List[str]:
+        return [key for key, source in self.sources.items() if source["stage"] == stage]
+
+    def advance(self, key: str, stage: str, **artefacts):
+        with self._lock:
+            self.sources[key].update(artefacts, stage=stage, error=None)
+            self.save()
+
+    def fail(self, key: str, error: Exception):
+        with self._lock:
+            self.sources[key]["error"] = str(error)
+            self.save()
+
+    def set_status(self, status: str):
+        with self._lock:
+            self.state["status"] = status
+            self.state["updated_at"] = time.time()
+            self.save()
+
+    def progress(self) -> Dict:
+        counts = {stage: 0 for stage in STAGES}
+        for source in self.sources.values():
+            counts[source["stage"]] += 1
+        return {
+            "job_id": self.job_id,
+            "status": self.state["status"],
+            "total": len(self.sources),
+            "stages": counts,
+            "errors": {key: s["error"] for key, s in self.sources.items() if s.get("error")},
+        }
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+
+def _write_chunks(path: str, chunks: List[Document]):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps({"page_content": chunk.page_content, "metadata": chunk.metadata}, ensure_ascii=False))
+            f.write("\n")
+
+
+def _read_chunks(path: str) -> List[Document]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [Document(**json.loads(line)) for line in f if line.strip()]
+
+
+def run_job(job: IngestionJob, persist_dir: Optional[str] = None, service=None) -> Dict:
+    """
+    Runs (or resumes) every remaining stage of ``job``. Sources that fail a
+    stage keep their last checkpoint and error; re-running the job retries them.
+    Returns the job progress.
+    """
+    service = service or get_rag_service()
+    job.set_status("running")
+    try:
+        _run_stages(job, persist_dir or service.persist_dir, service)
+    except Exception:
+        job.set_status("failed")
+        raise
+    progress = job.progress()
+    job.set_status("completed" if progress["stages"]["indexed"] == progress["total"] else "incomplete")
+    return job.progress()
+
+
+def _run_stages(job: IngestionJob, persist_dir: str, service):
+    # 1. parse: docling conversions run concurrently
+    pending = job.at_stage("pending")
+    if pending:
+        converted, failed = parse_documents(
+            pending,
+            os.path.join(job.dir, "markdown"),
+            inputs={key: job.sources[key]["input"] for key in pending},
+        )
+        for key, path in converted.items():
+            job.advance(key, "parsed", markdown=path)
+        for key, error in failed.items():
+            job.fail(key, error)
+
+    # 2. chunk
+    chunk_dir = os.path.join(job.dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    for key in job.at_stage("parsed"):
+        try:
+            markdown = job.sources[key]["markdown"]
+            with open(markdown, "r", encoding="utf-8") as f:
+                document_hash = content_hash(f.read())
+            chunks_path = os.path.join(chunk_dir, f"{content_hash(key)[:16]}.jsonl")
+            _write_chunks(chunks_path, chunk_document(markdown))
+            job.advance(key, "chunked", chunks=chunks_path, document_hash=document_hash)
+        except Exception as e:
+            logger.error(f"Chunking failed for {key}: {e}")
+            job.fail(key, e)
+
+    # 3. embed: batched across all chunked sources; vectors land in the
+    # persistent embedding cache, so indexing below does not recompute them
+    chunked = job.at_stage("chunked")
+    if chunked:
+        texts = [chunk.page_content for key in chunked for chunk in _read_chunks(job.sources[key]["chunks"])]
+        start = time.perf_counter()
+        service.embedding_model.embed_documents(texts)
+        logger.info(f"Embedded {len(texts)} chunks in {time.perf_counter() - start:.1f}s")
+        for key in chunked:
+            job.advance(key, "embedded")
+
+    # 4. index (sequential: one writer per store)
+    for key in job.at_stage("embedded"):
+        source = job.sources[key]
+        try:
+            index_chunks(
+                persist_dir,
+                _read_chunks(source["chunks"]),
+                service.embedding_model,
+                source=key,
+                document_hash=source["document_hash"],
+                metadata=source["metadata"],
+            )
+            job.advance(key, "indexed")
+            if source.get("crawled"):
+                # Only now may the next crawl treat this page as unchanged
+                confirm_validators(settings.CRAWL_CACHE_DIR, key)
+        except Exception as e:
+            logger.error(f"Indexing failed for {key}: {e}")
+            job.fail(key, e)
+
+
+def dropped_syllabus_sources(manifest: IngestionManifest, syllabus_url: str, urls: List[str]) -> List[str]:
+    """
+    Indexed pages of the syllabus site, tagged as syllabus material (shared
+    partition), that are not in ``urls``. Uploads and course material are
+    never included.
+    """
+    host = urlparse(syllabus_url).netloc
+    listed = set(urls)
+    return [
+        source for source in manifest.sources()
+        if source not in listed and urlparse(source).netloc == host
+        and manifest.tags(source) == chunk_tags(source, partition_metadata())
+    ]
+
+
+def syllabus_sources(syllabus_url: Optional[str] = None, max_lessons: Optional[int] = None,
+                     persist_dir: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Crawls the syllabus and returns the lesson pages that need (re)ingestion:
+    pages the server reports unchanged and that are already indexed with the
+    same partition metadata are left out. Changed pages are converted from the
+    crawler's cached HTML; their validators are confirmed once they are indexed.
+    Pages indexed from an earlier crawl that the syllabus no longer lists are
+    removed from the store.
+    """
+    max_lessons = settings.SYLLABUS_MAX_LESSONS if max_lessons is None else max_lessons
+    syllabus_url = syllabus_url or settings.WASABI_SYLLABUS_URL
+    persist_dir = persist_dir or settings.CHROMA_PERSIST_DIR
+    manifest = IngestionManifest(persist_dir)
+    metadata = partition_metadata()
+    with make_crawler() as crawler:
+        syllabus = get_syllabus(syllabus_url, crawler)
+        urls = [lesson['url'] for lesson in syllabus][:max_lessons]
+        pages = crawler.fetch_many(urls, defer_validators=True)
+
+    # Only a complete listing tells which pages are gone
+    if syllabus and len(syllabus) <= max_lessons:
+        dropped = dropped_syllabus_sources(manifest, syllabus_url, urls)
+        if dropped:
+            remove_sources(persist_dir, get_rag_service().embedding_model, dropped)
+
+    sources = {
+        url: {"input": pages[url].path, "metadata": metadata, "crawled": True}
+        for url in urls
+        if url in pages and (pages[url].changed or manifest.tags(url) != chunk_tags(url, metadata))
+    }
+    logger.info(f"Syllabus: {len(urls)} lessons, {len(pages)} fetched, {len(sources)} to (re)ingest")
+    return sources
+
+
+def ingest_syllabus(syllabus_url: Optional[str] = None, max_lessons: Optional[int] = None,
+                    job_id: Optional[str] = None, persist_dir: Optional[str] = None) -> Dict:
+    """
+    Creates (or resumes, when ``job_id`` exists) a syllabus ingestion job and runs it.
+    """
+    job = IngestionJob(job_id) if job_id else None
+    if job is None or not job.sources:
+        job = IngestionJob.create(syllabus_sources(syllabus_url, max_lessons, persist_dir), job_id)
+    return run_job(job, persist_dir)
+
+
+def ingest_urls(urls: List[str], course_id=None, jlpt_level: Optional[str] = None,
+                job_id: Optional[str] = None, persist_dir: Optional[str] = None) -> Dict:
+    metadata = partition_metadata(course_id, jlpt_level)
+    job = IngestionJob.create({url: {"input": url, "metadata": metadata} for url in urls}, job_id)
+    return run_job(job, persist_dir)
+
+
+def _safe_filename(filename: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", os.path.basename(filename)) or "document"
+
+
+def _scalar_metadata(metadata: Optional[Dict]) -> Dict:
+    """Vector stores only accept str/int/float/bool metadata values."""
+    return {k: v for k, v in (metadata or {}).items() if isinstance(v, (str, int, float, bool))}
+
+
+def create_upload_job(documents: List[Dict], course_id: int, work_dir: Optional[str] = None,
+                      user_id: Optional[int] = None) -> IngestionJob:
+    """
+    Stores documents uploaded to ``course_id`` by ``user_id`` in a new job
+    directory and returns the job. Text and Markdown uploads start out
+    parsed; other types (pdf, docx, html) arrive base64-encoded and go
+    through docling like any other source. Uploads are keyed by course and
+    filename, so re-uploading a file replaces its previous chunks in that
+    course only. Raises ValueError for content that is not valid base64.
+    """
+    if course_id is None:
+        raise ValueError("Uploads must belong to a course")
+    # Decode everything first so a bad file leaves no half-written job behind
+    contents = []
+    for doc in documents:
+        if doc["document_type"].lower() in TEXT_DOCUMENT_TYPES:
+            contents.append(doc["content"])
+            continue
+        try:
+            contents.append(base64.b64decode(doc["content"], validate=True))
+        except ValueError:
+            raise ValueError(f"{doc['filename']}: content is not valid base64") from None
+
+    job = IngestionJob(uuid.uuid4().hex, work_dir)
+    upload_dir = os.path.join(job.dir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    sources = {}
+    for doc, content in zip(documents, contents):
+        extra = doc.get("metadata") or {}
+        metadata = {
+            **_scalar_metadata(extra),
+            **partition_metadata(course_id, extra.get("jlpt_level")),
+            "filename": doc["filename"],
+            "document_type": doc["document_type"],
+        }
+        filename = _safe_filename(doc["filename"])
+        key = f"upload:{metadata['course_id']}/{filename}"
+        if isinstance(content, str):
+            path = os.path.join(upload_dir, f"{content_hash(key)[:12]}-{os.path.splitext(filename)[0]}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            sources[key] = {"stage": "parsed", "input": path, "markdown": path, "metadata": metadata}
+        else:
+            path = os.path.join(upload_dir, f"{content_hash(key)[:12]}-{filename}")
+            with open(path, "wb") as f:
+                f.write(content)
+            sources[key] = {"input": path, "metadata": metadata}
+
+    return IngestionJob.create(sources, job.job_id, work_dir, owner={"user_id": user_id, "course_id": course_id})
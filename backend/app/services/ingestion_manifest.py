@@ -0,0 +1,113 @@
+"""
+Ingestion manifest for the RAG vector store.
+
+Tracks, per source URL, a hash of the whole document and a hash per chunk so
+that re-ingestion only touches what changed: unchanged documents are skipped,
+new chunks are embedded and chunks that disappeared are deleted. Chunk ids are
+derived from the source and chunk content, so they are stable across runs and
+never collide between documents.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+MANIFEST_FILENAME = "ingestion_manifest.json"
+WRITE_LOCK_FILENAME = ".index.lock"
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of a text, used for documents and chunks."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_hash(chunk) -> str:
+    """Hash of a chunk's content together with its metadata."""
+    metadata = json.dumps(chunk.metadata, sort_keys=True, ensure_ascii=False, default=str)
+    return content_hash(chunk.page_content + "\0" + metadata)
+
+
+def chunk_id(source: str, digest: str) -> str:
+    """Stable vector id for a chunk of a given source."""
+    return f"{content_hash(source)[:16]}-{digest[:32]}"
+
+
+def collection_version(persist_dir: str) -> str:
+    """
+    Version of the indexed collection: the manifest's modification time.
+    The manifest is only rewritten when chunks are added or removed, so this
+    changes exactly when cached retrieval results become stale.
+    """
+    try:
+        return str(os.stat(os.path.join(persist_dir, MANIFEST_FILENAME)).st_mtime_ns)
+    except FileNotFoundError:
+        return "0"
+
+
+@contextmanager
+def index_write_lock(persist_dir: str):
+    """
+    Exclusive lock on the index files of ``persist_dir`` (vector store, BM25
+    index and manifest), held across threads and processes. Writers load,
+    modify and rewrite those files, so concurrent ingestion jobs must not
+    interleave.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, WRITE_LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class IngestionManifest:
+    """JSON manifest stored next to the vector store it describes."""
+
+    def __init__(self, persist_dir: str):
+        self.path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._sources: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._sources = json.load(f).get("sources", {})
+
+    def document_hash(self, source: str) -> Optional[str]:
+        entry = self._sources.get(source)
+        return entry["document_hash"] if entry else None
+
+    def chunk_ids(self, source: str) -> List[str]:
+        entry = self._sources.get(source)
+        return list(entry["chunks"]) if entry else []
+
+    def tags(self, source: str) -> Optional[Dict]:
+        """Metadata (partition, source) the source's chunks were indexed with."""
+        entry = self._sources.get(source)
+        return entry.get("tags") if entry else None
+
+    def is_unchanged(self, source: str, document_hash: str) -> bool:
+        return self.document_hash(source) == document_hash
+
+    def record(self, source: str, document_hash: str, chunks: Dict[str, str], tags: Optional[Dict] = None):
+        """Stores the document hash, the {chunk_id: chunk_hash} map and the chunk tags for a source."""
+        with self._lock:
+            self._sources[source] = {"document_hash": document_hash, "chunks": chunks, "tags": tags}
+
+    def remove(self, source: str):
+        with self._lock:
+            self._sources.pop(source, None)
+
+    def sources(self) -> List[str]:
+        return list(self._sources)
+
+    def save(self):
+        """Writes the manifest atomically."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"sources": self._sources}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
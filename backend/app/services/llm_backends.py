@@ -0,0 +1,236 @@
+"""
+Pluggable chat-model backends, selected by settings.LLM_BACKEND:
+
+- "gemini": Google Gemini over REST (default).
+- "local":  a small instruction-tuned HuggingFace model (settings.HF_MODEL_NAME)
+            on CPU. Concurrent requests are collected by a DynamicBatcher and
+            decoded together in one ``generate`` call, which costs little more
+            than a single request on CPU.
+- "stub":   deterministic answers after an optional fixed delay, for tests and
+            for benchmarking the chain without any model.
+
+All backends are LangChain chat models, so the RAG chain does not change.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHAT_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def to_chat_messages(messages) -> List[Dict[str, str]]:
+    """LangChain messages -> chat-template dicts."""
+    return [{"role": CHAT_ROLES.get(m.type, "user"), "content": m.content} for m in messages]
+
+
+class DynamicBatcher:
+    """
+    Runs ``fn(items) -> results`` over batches of concurrently submitted items.
+    A batch closes when it has ``max_batch_size`` items or ``max_wait_ms``
+    after its first item arrived, whichever comes first.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 4, max_wait_ms: float = 25):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+
+    def submit(self, item) -> Future:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _deliver(future: Future, result=None, error: Exception = None):
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except Exception as e:
+            logger.warning(f"Dropped a batched result: {e}")
+
+    def _loop(self):
+        while True:
+            # Callers that gave up (cancelled futures) are not decoded at all;
+            # the others can no longer be cancelled once marked running.
+            batch = [(item, future) for item, future in self._next_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    self._deliver(future, error=e)
+                continue
+            for (_, future), result in zip(batch, results):
+                self._deliver(future, result)
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+
+class LocalGenerator:
+    """Greedy batched generation with a HuggingFace causal LM on CPU (loaded lazily)."""
+
+    def __init__(self, model_name: str, max_new_tokens: int = 512, threads: int = 0):
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.threads = threads
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import torch
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                logger.info(f"Loading local LLM {self.model_name}")
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name, token=settings.HF_TOKEN)
+                tokenizer.padding_side = "left"  # decoder-only batches are padded on the left
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                model = AutoModelForCausalLM.from_pretrained(self.model_name, token=settings.HF_TOKEN, torch_dtype=torch.float32)
+                model.eval()
+                self._tokenizer, self._model = tokenizer, model
+
+    def __call__(self, conversations: List[List[Dict[str, str]]]) -> List[str]:
+        if self._model is None:
+            self._load()
+        import torch
+        prompts = [
+            self._tokenizer.apply_chat_template(c, tokenize=False, add_generation_prompt=True)
+            for c in conversations
+        ]
+        inputs = self._tokenizer(prompts, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            output = self._model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                pad_token_id=self._tokenizer.pad_token_id,
+            )
+        return self._tokenizer.batch_decode(output[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+
+class LocalChatModel(BaseChatModel):
+    """Chat model whose requests are batched by ``batcher`` across concurrent callers."""
+
+    batcher: Any
+    model_name: str = ""
+
+    @property
+    def _llm_type(self):
+        return "local-batched"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.batcher.submit(to_chat_messages(messages)).result()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        future = self.batcher.submit(to_chat_messages(messages))
+        text = await asyncio.wrap_future(future)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic model: answers with a fixed prefix and the first line of the
+    last message after ``latency`` seconds. Streams word by word.
+    """
+
+    latency: float = 0.0
+    prefix: str = "[stub]"
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _answer(self, messages) -> str:
+        last = messages[-1].content if messages else ""
+        return f"{self.prefix} {last.strip().splitlines()[-1][:200] if last.strip() else ''}".strip()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(self._answer(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(self._answer(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for word in self._answer(messages).split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for word in self._answer(messages).split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def llm_model_name(backend=None) -> str:
+    backend = backend or settings.LLM_BACKEND
+    return {"gemini": settings.GEMINI_MODEL, "local": settings.HF_MODEL_NAME}.get(backend, backend)
+
+
+def make_llm(backend=None) -> BaseChatModel:
+    """Chat model for ``backend`` (default settings.LLM_BACKEND)."""
+    backend = backend or settings.LLM_BACKEND
+    if backend == "stub":
+        return StubChatModel(latency=settings.LLM_STUB_LATENCY_MS / 1000)
+    if backend == "local":
+        generator = LocalGenerator(settings.HF_MODEL_NAME, settings.LLM_MAX_TOKENS, settings.LOCAL_LLM_THREADS)
+        batcher = DynamicBatcher(generator, settings.LOCAL_LLM_MAX_BATCH, settings.LOCAL_LLM_BATCH_WAIT_MS)
+        return LocalChatModel(batcher=batcher, model_name=settings.HF_MODEL_NAME)
+    if backend == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=settings.GEMINI_MODEL,
+            temperature=0,
+            api_key=settings.GOOGLE_API_KEY,
+            max_tokens=settings.LLM_MAX_TOKENS,
+            transport="rest",
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,404 @@
+"""
+LLM gateway: every LLM call of the process goes through one LLMGateway.
+
+- Concurrency limit: at most ``max_concurrency`` calls in flight; callers
+  queue (sync threads and async tasks alike) up to ``queue_timeout`` seconds,
+  and are turned away at once when ``max_queue`` callers are already waiting.
+- Adaptive backoff: a rate-limit error halves the concurrency limit and the
+  call is retried with exponential backoff and jitter; the limit grows back
+  by one after a full window of successes (AIMD).
+- Single-flight: identical prompts in flight at the same time share one call
+  (all backends decode greedily, so the answer would be the same).
+- Circuit breaker: after ``breaker_threshold`` consecutive failures calls fail
+  fast for ``breaker_cooldown`` seconds, then one trial call is let through.
+
+Calls that are shed, time out in the queue, exhaust their rate-limit retries
+or hit an open breaker raise LLMUnavailable, which callers turn into a fast
+fallback response instead of a 500.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(Exception):
+    """The LLM cannot take this call right now (overload or open circuit)."""
+
+
+def is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    name = type(error).__name__
+    return status == 429 or "ResourceExhausted" in name or "RateLimit" in name or "429" in str(error)
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.granted = False
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    FIFO concurrency limiter usable from threads and event loops at once,
+    with an AIMD-adjusted limit between 1 and ``max_limit``.
+    """
+
+    def __init__(self, max_limit: int, max_queue: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._successes = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Takes a slot (True) or queues ``waiter`` (False)."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                raise LLMUnavailable("LLM queue is full")
+            self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraws a waiter; True if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _grant_free_slots(self):
+        # with self._lock held
+        while self._waiters and self.active < self.limit:
+            self.active += 1
+            self._waiters.popleft().grant()
+
+    def acquire(self, timeout: float):
+        waiter = _Waiter()
+        if self._enter(waiter):
+            return
+        if not waiter.event.wait(timeout) and not self._abandon(waiter):
+            raise LLMUnavailable("Timed out waiting for an LLM slot")
+
+    async def acquire_async(self, timeout: float):
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enter(waiter):
+            return
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise LLMUnavailable("Timed out waiting for an LLM slot")
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant_free_slots()
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._grant_free_slots()
+
+    def on_rate_limit(self):
+        with self._lock:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self._changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self._changed_at < self.cooldown:
+                return False
+            # open -> half-open; a trial that never reports back is replaced after another cooldown
+            self.state = "half_open"
+            self._changed_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                    self.opens += 1
+                self.state = "open"
+                self._changed_at = time.monotonic()
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 200, queue_timeout: float = 20.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, breaker_threshold: int = 5,
+                 breaker_cooldown: float = 30.0):
+        self.limiter = AdaptiveLimiter(max_concurrency, max_queue)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=1024)
+        self.counters = {"calls": 0, "coalesced": 0, "rejected": 0, "rate_limited": 0, "failures": 0}
+
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+
+    def admit(self):
+        """Waits for a concurrency slot; the caller must ``limiter.release()`` it."""
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise LLMUnavailable("LLM circuit is open")
+        start = time.perf_counter()
+        try:
+            self.limiter.acquire(self.queue_timeout)
+        except LLMUnavailable:
+            self.counters["rejected"] += 1
+            raise
+        self._waits.append(time.perf_counter() - start)
+        self.counters["calls"] += 1
+
+    async def aadmit(self):
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise LLMUnavailable("LLM circuit is open")
+        start = time.perf_counter()
+        try:
+            await self.limiter.acquire_async(self.queue_timeout)
+        except LLMUnavailable:
+            self.counters["rejected"] += 1
+            raise
+        self._waits.append(time.perf_counter() - start)
+        self.counters["calls"] += 1
+
+    def on_success(self):
+        self.breaker.record_success()
+        self.limiter.on_success()
+
+    def on_failure(self, error: Exception):
+        if is_rate_limited(error):
+            self.counters["rate_limited"] += 1
+            self.limiter.on_rate_limit()
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """A rate-limited attempt shrinks the limit and is retried while attempts remain."""
+        if not is_rate_limited(error):
+            return False
+        self.counters["rate_limited"] += 1
+        self.limiter.on_rate_limit()
+        return attempt < self.max_retries
+
+    def _give_up(self, error: Exception):
+        """Records the failed call once towards the breaker and raises."""
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+        if is_rate_limited(error):
+            raise LLMUnavailable("LLM rate limit persisted after retries") from error
+        raise error
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        self.admit()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = fn()
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        self._give_up(e)
+                    time.sleep(self._backoff(attempt))
+                    continue
+                self.on_success()
+                return result
+        finally:
+            self.limiter.release()
+
+    async def acall(self, fn: Callable[[], Any]) -> Any:
+        await self.aadmit()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if not self._should_retry(e, attempt):
+                        self._give_up(e)
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                self.on_success()
+                return result
+        finally:
+            self.limiter.release()
+
+    def _join(self, key: str):
+        """Returns (future, is_leader) for the in-flight call identified by ``key``."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error if isinstance(error, Exception) else LLMUnavailable("LLM call was cancelled"))
+
+    def coalesced_call(self, key: str, fn: Callable[[], Any]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = self.call(fn)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def acoalesced_call(self, key: str, fn: Callable[[], Any]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded: a cancelled follower must not cancel the shared future under the leader
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await self.acall(fn)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+        return {
+            **self.counters,
+            "in_flight": self.limiter.active,
+            "queue_depth": self.limiter.queue_depth,
+            "concurrency_limit": self.limiter.limit,
+            "wait_ms_avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+            "wait_ms_p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+            "breaker": {"state": self.breaker.state, "opens": self.breaker.opens},
+        }
+
+
+def prompt_key(messages, stop=None, **kwargs) -> str:
+    payload = json.dumps(
+        [[m.type, m.content] for m in messages] + [stop, sorted(kwargs.items())],
+        ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GatewayChatModel(BaseChatModel):
+    """Routes every call of ``inner`` through ``gateway``; streams are limited but neither coalesced nor retried."""
+
+    inner: BaseChatModel
+    gateway: Any
+
+    @property
+    def _llm_type(self):
+        return f"gateway-{self.inner._llm_type}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.gateway.coalesced_call(
+            prompt_key(messages, stop, **kwargs),
+            lambda: self.inner._generate(messages, stop=stop, **kwargs),
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.gateway.acoalesced_call(
+            prompt_key(messages, stop, **kwargs),
+            lambda: self.inner._agenerate(messages, stop=stop, **kwargs),
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # The slot is held until the stream ends or is closed
+        self.gateway.admit()
+        try:
+            for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+                yield ChatGenerationChunk(message=chunk)
+        except Exception as e:
+            self.gateway.on_failure(e)
+            raise
+        else:
+            self.gateway.on_success()
+        finally:
+            self.gateway.limiter.release()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await self.gateway.aadmit()
+        try:
+            async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+                yield ChatGenerationChunk(message=chunk)
+        except Exception as e:
+            self.gateway.on_failure(e)
+            raise
+        else:
+            self.gateway.on_success()
+        finally:
+            self.gateway.limiter.release()
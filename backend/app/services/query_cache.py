@@ -0,0 +1,168 @@
+"""
+Query-side caches for the RAG retriever.
+
+An in-process LRU sits in front of an optional Redis tier (settings.REDIS_URL)
+and is used for query embeddings and for top-k retrieval results. Retrieval
+entries are keyed by the collection version, so re-indexing invalidates them
+without an explicit flush. Every cache keeps hit/miss counters for
+``/api/rag/system-status``.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.embedding_cache import text_key
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe bounded LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    In-process LRU backed by an optional Redis tier. Values must be
+    JSON-serializable; ``encode``/``decode`` adapt richer types.
+    """
+
+    def __init__(self, name: str, maxsize: int, redis_client=None, ttl: int = 3600,
+                 encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None):
+        self.name = name
+        self.local = LRUCache(maxsize)
+        self.redis = redis_client
+        self.ttl = ttl
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+        self.redis_hits = 0
+
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            raw = self.redis.get(f"{self.name}:{key}")
+        except Exception as e:
+            logger.warning(f"Redis cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        self.redis_hits += 1
+        value = self.decode(json.loads(raw))
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self.local.set(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{self.name}:{key}", json.dumps(self.encode(value), ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Redis cache write failed: {e}")
+
+    def stats(self):
+        lookups = self.local.hits + self.local.misses
+        hits = self.local.hits + self.redis_hits
+        return {
+            "size": len(self.local),
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "redis": self.redis is not None,
+        }
+
+
+def connect_redis(url: str):
+    """Returns a Redis client, or None when redis is unavailable."""
+    try:
+        import redis
+        client = redis.Redis.from_url(url, socket_timeout=0.2)
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning(f"Redis cache tier disabled: {e}")
+        return None
+
+
+def _encode_docs(docs: List[Document]):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+def _decode_docs(items) -> List[Document]:
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in items]
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Retriever wrapper caching top-k results per (collection version, partition, k, query).
+    ``version`` is called on every lookup so a re-index invalidates entries.
+    The async path runs the whole lookup (query embedding, vector search, cache
+    I/O) on ``executor`` so the event loop is never blocked.
+    """
+
+    retriever: BaseRetriever
+    cache: Any
+    version: Callable[[], str]
+    k: int
+    partition: str = ""
+    executor: Optional[Executor] = None
+
+    def _key(self, query: str) -> str:
+        return text_key(f"{self.version()}:{self.partition}:{self.k}", query)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        key = self._key(query)
+        docs = self.cache.get(key)
+        if docs is None:
+            docs = self.retriever.invoke(query)
+            self.cache.set(key, docs)
+        return docs
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_relevant_documents, query)
+
+
+def make_retrieval_cache(maxsize: int, redis_client=None, ttl: int = 3600) -> TieredCache:
+    return TieredCache("rag:retrieval", maxsize, redis_client, ttl, encode=_encode_docs, decode=_decode_docs)
+
+
+def make_query_embedding_cache(maxsize: int, redis_client=None, ttl: int = 86400) -> TieredCache:
+    return TieredCache("rag:query-embedding", maxsize, redis_client, ttl)
@@ -0,0 +1,95 @@
+"""
+Pre-generated quiz questions.
+
+Questions are stored in SQLite per bucket (topic, JLPT level, difficulty,
+question type) together with the embedding of their text. A request is
+served from its buckets, least-served questions first, and the buckets are
+topped up in the background. New questions whose cosine similarity to a
+stored question of the same bucket reaches the threshold are dropped as
+near-duplicates.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.embedding_cache import normalize_text
+
+
+def quiz_bucket(topic: str, jlpt_level, difficulty: str, question_type: str) -> str:
+    return "|".join([normalize_text(topic).lower(), jlpt_level or "any", difficulty, question_type])
+
+
+def question_text(question: Dict) -> str:
+    """Text used for near-duplicate detection: the question and its options."""
+    return " ".join([question["question"]] + [str(option) for option in question.get("options") or []])
+
+
+class QuizBank:
+    def __init__(self, path: str, dedup_threshold: float = 0.92):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.dedup_threshold = dedup_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "id INTEGER PRIMARY KEY, bucket TEXT NOT NULL, question TEXT NOT NULL, "
+            "vector BLOB NOT NULL, served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS questions_bucket ON questions (bucket, served)")
+        self._conn.commit()
+        self.stats = {"served": 0, "added": 0, "duplicates": 0}
+
+    def count(self, bucket: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM questions WHERE bucket = ?", (bucket,)).fetchone()[0]
+
+    def recent(self, bucket: str, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question FROM questions WHERE bucket = ? ORDER BY created_at DESC LIMIT ?", (bucket, limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def take(self, bucket: str, n: int) -> List[Dict]:
+        """Up to ``n`` questions, least-served first (random among equals)."""
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, question FROM questions WHERE bucket = ? ORDER BY served, RANDOM() LIMIT ?", (bucket, n)
+            ).fetchall()
+            self._conn.executemany("UPDATE questions SET served = served + 1 WHERE id = ?", [(row[0],) for row in rows])
+            self._conn.commit()
+        self.stats["served"] += len(rows)
+        return [json.loads(row[1]) for row in rows]
+
+    def add(self, bucket: str, questions: List[Dict], vectors: List[List[float]], served: bool = False) -> List[Dict]:
+        """Stores the questions that are not near-duplicates; returns them."""
+        if not questions:
+            return []
+        candidates = np.asarray(vectors, dtype=np.float32)
+        candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            rows = self._conn.execute("SELECT vector FROM questions WHERE bucket = ?", (bucket,)).fetchall()
+            known = [np.frombuffer(row[0], dtype=np.float32) for row in rows]
+            added, inserts = [], []
+            for question, vector in zip(questions, candidates):
+                if known and float(np.max(np.stack(known) @ vector)) >= self.dedup_threshold:
+                    self.stats["duplicates"] += 1
+                    continue
+                known.append(vector)
+                added.append(question)
+                inserts.append((bucket, json.dumps(question, ensure_ascii=False),
+                                array("f", vector.tolist()).tobytes(), int(served), time.time()))
+            self._conn.executemany(
+                "INSERT INTO questions (bucket, question, vector, served, created_at) VALUES (?, ?, ?, ?, ?)", inserts
+            )
+            self._conn.commit()
+        self.stats["added"] += len(added)
+        return added
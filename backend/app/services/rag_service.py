@@ -5,14 +5,18 @@ This module provides functions and classes for a Retrieval-Augmented Generation
 focused on Japanese language teaching. It integrates document parsing, chunking, embedding,
 vector storage, and conversational retrieval using LLMs (HuggingFace or Google Gemini).
 
+Heavy resources (HuggingFace login, embedding model, LLM, vector store) are
+created lazily by RAGService on first use, or eagerly via RAGService.warm_up()
+during application startup. Importing this module has no side effects.
+
 Sections:
 1. Imports and API Key Setup
-2. Embedding and LLM Model Initialization
+2. Embedding and LLM Model Initialization (lazy RAGService)
 3. Document Parsing and Chunking
 4. Vector Store Indexing and Retrieval
 5. Syllabus Extraction from HTML
 6. RAG Chain Initialization and Querying
-7. Chat History Management
+7. Chat History Management (bounded per-session store)
 
 Author: [Your Name]
 Date: [Current Date]
@@ -21,149 +25,1069 @@ Date: [Current Date]
 # ------------------------------
 # 1. Imports and API Key Setup
 # ------------------------------
+import asyncio
+import json
 import subprocess
 import os
 import glob
 import shutil
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tempfile import TemporaryDirectory
-import requests
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
 
-from huggingface_hub import login
-from langchain.vectorstores import Chroma
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_huggingface import ChatHuggingFace, HuggingFacePipeline
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain import PromptTemplate
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
-from langchain.chains import create_history_aware_retriever
 
-# Retrieve API keys from environment variables
-hf_token = os.environ.get('HF_TOKEN')
-google_api = os.environ.get("GOOGLE_API_KEY")
-login(hf_token)  # Authenticate with HuggingFace Hub
+from app.core.config import settings
+from app.services.chat_history import ChatHistoryStore, InMemoryHistoryBackend, RedisHistoryBackend
+from app.services.crawler import SyllabusCrawler
+from app.services.context_packer import estimate_tokens, pack_context
+from app.services.llm_backends import llm_model_name, make_llm
+from app.services.llm_gateway import GatewayChatModel, LLMGateway, LLMUnavailable
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.services.ingestion_manifest import (
+    IngestionManifest, collection_version, content_hash, chunk_hash, chunk_id, index_write_lock
+)
+from app.services.vector_store import dense_search_kwargs, open_vector_store, partition_filter, partition_metadata
+from app.services.reranker import CrossEncoderReranker, RerankingRetriever
+from app.services.sparse_index import HybridRetriever, SparseIndex
+from app.services.semantic_cache import SemanticResponseCache
+from app.services.quiz_bank import QuizBank, question_text, quiz_bucket
+from app.services.query_cache import CachedRetriever, connect_redis, make_query_embedding_cache, make_retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+# API keys are read from settings (HF_TOKEN / GOOGLE_API_KEY) and only used
+# when the engine is initialized, never at import time.
 
 # ------------------------------
 # 2. Embedding and LLM Model Initialization
 # ------------------------------
 
-# Set up the embedding model for document chunk vectorization
-model_name = "Mohamed-Gamil/multilingual-e5-small-JapaneseTeacher"
-embedding_model = HuggingFaceEmbeddings(model_name=model_name)
-
-# Set up the LLM model for conversational generation
-# Option 1: HuggingFace model (commented out)
-# Option 2: Google Gemini model (active)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite",
-    temperature=0,
-    api_key=google_api,
-    max_tokens=512,
-    transport="rest",
-    # Optionally set timeout etc.
-)
+RELOAD_CHECK_INTERVAL = 5.0  # seconds between checks for a collection re-indexed by another process
+
+
+class RAGService:
+    """
+    Owns the heavy RAG resources (embedding model, LLM, retriever).
+
+    Nothing is loaded on construction: each resource is created on first
+    access under a lock, so importing this module and instantiating the
+    service is cheap. Call ``warm_up()`` to pay the loading cost up front.
+    """
+
+    def __init__(self, persist_dir=None, embedding_model_name=None):
+        self.persist_dir = persist_dir or settings.CHROMA_PERSIST_DIR
+        self.embedding_model_name = embedding_model_name or settings.RAG_EMBEDDING_MODEL
+        self._lock = threading.RLock()
+        self._hf_logged_in = False
+        self._embedding_model = None
+        self._llm = None
+        self._vector_db = None
+        self._retriever = None
+        self._sparse_index = None
+        self._chains = {}
+        self._loaded_version = None
+        self._version_checked_at = 0.0
+        self.reranker = CrossEncoderReranker(
+            settings.RERANKER_MODEL,
+            batch_size=settings.RERANK_BATCH_SIZE,
+            budget_ms=settings.RERANK_BUDGET_MS,
+        )
+        # CPU-bound query embedding and vector search run here, off the event loop
+        self.embedding_executor = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_WORKERS, thread_name_prefix="embedding"
+        )
+        redis_client = connect_redis(settings.REDIS_URL) if settings.QUERY_CACHE_USE_REDIS else None
+        self.query_embedding_cache = make_query_embedding_cache(
+            settings.QUERY_CACHE_SIZE, redis_client, ttl=settings.QUERY_CACHE_TTL * 24
+        )
+        self.retrieval_cache = make_retrieval_cache(
+            settings.QUERY_CACHE_SIZE, redis_client, ttl=settings.QUERY_CACHE_TTL
+        )
+        history_redis = (redis_client or connect_redis(settings.REDIS_URL)) if settings.CHAT_HISTORY_USE_REDIS else None
+        if history_redis is not None:
+            history_backend = RedisHistoryBackend(history_redis, ttl=settings.CHAT_HISTORY_TTL)
+        else:
+            history_backend = InMemoryHistoryBackend(ttl=settings.CHAT_HISTORY_TTL)
+        self.history_store = ChatHistoryStore(
+            history_backend,
+            max_turns=settings.CHAT_HISTORY_MAX_TURNS,
+            summarize_batch=settings.CHAT_HISTORY_SUMMARIZE_BATCH,
+            summarizer=self.summarize_history,
+        )
+        self.response_cache = SemanticResponseCache(
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            ttl=settings.SEMANTIC_CACHE_TTL,
+            maxsize=settings.SEMANTIC_CACHE_SIZE,
+        )
+        self._quiz_bank = None
+        self._quiz_top_ups = {}
+        self.llm_gateway = LLMGateway(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue=settings.LLM_QUEUE_MAX,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base=settings.LLM_BACKOFF_BASE,
+            breaker_threshold=settings.LLM_BREAKER_THRESHOLD,
+            breaker_cooldown=settings.LLM_BREAKER_COOLDOWN,
+        )
+
+    def _hf_login(self):
+        """Authenticate with HuggingFace Hub once, if a token is configured."""
+        if self._hf_logged_in or not settings.HF_TOKEN:
+            return
+        from huggingface_hub import login
+        login(settings.HF_TOKEN)
+        self._hf_logged_in = True
+
+    @property
+    def embedding_model(self):
+        """
+        Embedding model for document chunk vectorization (loaded lazily),
+        wrapped with batching and the persistent embedding cache.
+        """
+        if self._embedding_model is None:
+            with self._lock:
+                if self._embedding_model is None:
+                    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+                    self._hf_login()
+                    logger.info(f"Loading embedding model {self.embedding_model_name}")
+                    base = HuggingFaceEmbeddings(
+                        model_name=self.embedding_model_name,
+                        encode_kwargs={"batch_size": settings.EMBEDDING_BATCH_SIZE},
+                    )
+                    self._embedding_model = CachedEmbeddings(
+                        base,
+                        self.embedding_model_name,
+                        EmbeddingCache(settings.EMBEDDING_CACHE_PATH),
+                        batch_size=settings.EMBEDDING_BATCH_SIZE,
+                        query_cache=self.query_embedding_cache,
+                    )
+        return self._embedding_model
+
+    @property
+    def llm(self):
+        """
+        Chat model for generation (loaded lazily); backend per settings.LLM_BACKEND.
+        Every call goes through the process-wide LLM gateway.
+        """
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = GatewayChatModel(inner=make_llm(), gateway=self.llm_gateway)
+        return self._llm
+
+    @property
+    def quiz_bank(self):
+        """Pre-generated quiz questions (SQLite, opened lazily)."""
+        if self._quiz_bank is None:
+            with self._lock:
+                if self._quiz_bank is None:
+                    self._quiz_bank = QuizBank(settings.QUIZ_BANK_PATH, dedup_threshold=settings.QUIZ_DEDUP_THRESHOLD)
+        return self._quiz_bank
+
+    @property
+    def vector_db(self):
+        """Persisted vector store at ``persist_dir`` (opened lazily, backend per settings)."""
+        if self._vector_db is None:
+            with self._lock:
+                if self._vector_db is None:
+                    self._vector_db = open_vector_store(self.persist_dir, self.embedding_model)
+        return self._vector_db
+
+    @property
+    def retriever(self):
+        """Retriever over the persisted vector store."""
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    self._retriever = self.get_retriever(settings.TOP_K_RETRIEVAL)
+        return self._retriever
+
+    @property
+    def sparse_index(self):
+        """
+        BM25 index persisted next to the vector store. Rebuilt from the vector store once
+        if the store predates the sparse index.
+        """
+        if self._sparse_index is None:
+            with self._lock:
+                if self._sparse_index is None:
+                    sparse_index = SparseIndex(self.persist_dir)
+                    if not len(sparse_index):
+                        with index_write_lock(self.persist_dir):
+                            rebuild_sparse_index(self.vector_db, sparse_index)
+                    self._sparse_index = sparse_index
+        return self._sparse_index
+
+    def get_retriever(self, k, retrieval_filter=None):
+        """
+        Top-k retriever (hybrid BM25 + dense when enabled) restricted to the
+        ``retrieval_filter`` partition, with results cached per collection version.
+        With re-ranking enabled, a wider candidate set is retrieved and the
+        cross-encoder keeps the best k.
+        """
+        self.reload_if_reindexed()
+        top_k = k
+        if settings.RERANK_ENABLED:
+            k = max(k, settings.RERANK_CANDIDATES)
+        if settings.HYBRID_RETRIEVAL_ENABLED:
+            retriever = HybridRetriever(
+                dense=self.vector_db.as_retriever(
+                    search_kwargs=dense_search_kwargs(max(k, settings.HYBRID_CANDIDATES), retrieval_filter)
+                ),
+                sparse=self.sparse_index,
+                k=k,
+                candidates=settings.HYBRID_CANDIDATES,
+                rrf_k=settings.RRF_K,
+                filter=retrieval_filter,
+            )
+        else:
+            retriever = self.vector_db.as_retriever(search_kwargs=dense_search_kwargs(k, retrieval_filter))
+        if settings.RERANK_ENABLED:
+            retriever = RerankingRetriever(base=retriever, reranker=self.reranker, top_n=top_k)
+        return CachedRetriever(
+            retriever=retriever,
+            cache=self.retrieval_cache,
+            version=self.collection_version,
+            k=top_k,
+            partition=json.dumps(retrieval_filter, sort_keys=True),
+            executor=self.embedding_executor,
+        )
+
+    async def aembed_query(self, text):
+        """Embeds a query on the dedicated embedding pool."""
+        loop = asyncio.get_running_loop()
+        # Resolve the (lazily loaded) model inside the pool, not on the loop
+        return await loop.run_in_executor(self.embedding_executor, lambda: self.embedding_model.embed_query(text))
+
+    def collection_version(self):
+        return collection_version(self.persist_dir)
+
+    def reload_if_reindexed(self):
+        """
+        Ingestion runs in other processes (worker, CLI). When the collection
+        version moved since the store was opened, drops the open store and the
+        cached chains so the next access serves the new content. Checked at
+        most every RELOAD_CHECK_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self._version_checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._version_checked_at = now
+        version = self.collection_version()
+        if version == self._loaded_version:
+            return
+        with self._lock:
+            if self._loaded_version is not None and version != self._loaded_version:
+                logger.info(f"Collection re-indexed (version {version}), reopening the vector store")
+                self.reset()
+            self._loaded_version = version
+
+    @property
+    def llm_config(self):
+        """Identifies the LLM configuration a cached chain was built with."""
+        return (settings.LLM_BACKEND, llm_model_name(), settings.LLM_MAX_TOKENS)
+
+    def get_chain(self, k=None, course_id=None, jlpt_level=None):
+        """
+        Returns the RAG chain for this store, building it only the first time
+        for a given (vector store, k, partition, prompt version, LLM config).
+        The partition restricts retrieval to the course's and shared chunks.
+        """
+        self.reload_if_reindexed()
+        retrieval_filter = partition_filter(course_id, jlpt_level, by_jlpt=settings.RAG_FILTER_BY_JLPT)
+        key = self._chain_key(k, retrieval_filter)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    logger.info(f"Building RAG chain for {key}")
+                    chain = init_rag(self.llm, self.get_retriever(key[1], retrieval_filter))
+                    self._chains[key] = chain
+        return chain
+
+    def _chain_key(self, k, retrieval_filter):
+        return (
+            self.persist_dir,
+            k or settings.TOP_K_RETRIEVAL,
+            json.dumps(retrieval_filter, sort_keys=True),
+            PROMPT_VERSION,
+            self.llm_config,
+        )
+
+    async def aget_chain(self, k=None, course_id=None, jlpt_level=None):
+        """
+        Async get_chain: a first-time build loads models, so it runs in a thread.
+        """
+        self.reload_if_reindexed()
+        retrieval_filter = partition_filter(course_id, jlpt_level, by_jlpt=settings.RAG_FILTER_BY_JLPT)
+        chain = self._chains.get(self._chain_key(k, retrieval_filter))
+        if chain is None:
+            chain = await asyncio.to_thread(self.get_chain, k, course_id, jlpt_level)
+        return chain
+
+    @property
+    def is_ready(self):
+        return bool(self._chains)
+
+    def warm_up(self):
+        """
+        Eagerly loads every resource. Safe to call from several threads;
+        only the first caller does the work.
+        """
+        logger.info("Warming up RAG engine...")
+        self.get_chain()
+        logger.info("RAG engine ready")
+
+    def reset(self):
+        """Drops loaded resources so the next access reloads them (e.g. after re-indexing)."""
+        with self._lock:
+            self._vector_db = None
+            self._retriever = None
+            self._sparse_index = None
+            self._chains = {}
+
+    async def get_system_status(self):
+        """
+        Reports engine readiness, the indexed collection version and cache hit rates.
+        """
+        embedding_stats = self._embedding_model.stats if self._embedding_model is not None else {}
+        batcher = getattr(self._llm.inner, "batcher", None) if self._llm is not None else None
+        return {
+            "ready": self.is_ready,
+            "persist_dir": self.persist_dir,
+            "collection_version": self.collection_version(),
+            "embedding": embedding_stats,
+            "reranker": self.reranker.stats if settings.RERANK_ENABLED else None,
+            "llm": {
+                "backend": settings.LLM_BACKEND,
+                "model": llm_model_name(),
+                "batching": batcher.stats if batcher is not None else None,
+                "gateway": self.llm_gateway.stats(),
+            },
+            "caches": {
+                "query_embedding": self.query_embedding_cache.stats(),
+                "retrieval": self.retrieval_cache.stats(),
+                "semantic_response": self.response_cache.stats(),
+            },
+            "quiz_bank": dict(
+                self._quiz_bank.stats if self._quiz_bank is not None else {},
+                top_ups_running=len(self._quiz_top_ups),
+            ),
+        }
+
+    def summarize_history(self, summary, turns):
+        """
+        Folds older chat turns into the session's rolling summary with the LLM.
+        """
+        transcript = "\n".join(f"Student: {t['query']}\nTeacher: {t['response']}" for t in turns)
+        prompt = ChatPromptTemplate([
+            ("system", history_summary_prompt),
+            ("user", "Current summary:\n{summary}\n\nNew exchanges:\n{transcript}"),
+        ])
+        chain = prompt | self.llm | StrOutputParser()
+        return chain.invoke({"summary": summary or "(none)", "transcript": transcript})
+
+    async def _resolve_history(self, session_id, conversation_history):
+        """
+        Server-side session history when a session id is given; otherwise the
+        client-supplied history, capped to the same number of turns.
+        """
+        if session_id:
+            return await asyncio.to_thread(self.history_store.get_messages, session_id)
+        return history_to_messages(conversation_history)[-2 * settings.CHAT_HISTORY_MAX_TURNS:]
+
+    async def _remember(self, session_id, query, response):
+        if session_id:
+            await asyncio.to_thread(self.history_store.append, session_id, query, response)
+
+    async def _cache_lookup(self, query, user_context, course_id, history):
+        """
+        Returns (cache key, cached response) for first-turn questions; the key is
+        None when the request is not cacheable.
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED or history:
+            return None, None
+        version = await asyncio.to_thread(self.collection_version)
+        # The whole learner profile goes into the prompt (level, role,
+        # preferences), so answers are only shared between identical profiles
+        profile = json.dumps(user_context or {}, sort_keys=True, ensure_ascii=False, default=str)
+        partition = (course_id, profile, version)
+        query_vector = await self.aembed_query(query)
+        cache_key = (partition, query_vector)
+        # Linear similarity scan over the cache: CPU-bound, off the event loop
+        return cache_key, await asyncio.to_thread(self.response_cache.lookup, partition, query_vector)
+
+    def _cache_store(self, cache_key, response_data):
+        if cache_key is not None and NO_ANSWER not in response_data["response"]:
+            self.response_cache.store(*cache_key, response_data)
+
+    @staticmethod
+    def _fallback_response(user_context):
+        """Immediate answer while the LLM is overloaded; neither cached nor kept in history."""
+        return {
+            "response": LLM_BUSY_ANSWER,
+            "sources": [],
+            "jlpt_level": (user_context or {}).get("jlpt_level"),
+            "fallback": True,
+        }
+
+    @staticmethod
+    def _chain_inputs(query, user_context, history):
+        return {
+            "input": query,
+            "chat_history": history,
+            "user_context": user_context,
+        }
+
+    async def generate_response(self, query, user_context=None, course_id=None, conversation_history=None,
+                                session_id=None):
+        """
+        Answers a chat query with the cached RAG chain.
+        With a ``session_id`` the bounded server-side history is used and updated;
+        ``conversation_history`` is only a fallback for session-less clients.
+        First-turn questions are served from the semantic response cache when a
+        near-identical question was answered for the same course and JLPT level.
+        Returns the response text and the sources it was grounded on.
+        """
+        history = await self._resolve_history(session_id, conversation_history)
+        cache_key, cached = await self._cache_lookup(query, user_context, course_id, history)
+        if cached is not None:
+            await self._remember(session_id, query, cached["response"])
+            return dict(cached, cached=True)
+
+        chain = await self.aget_chain(course_id=course_id, jlpt_level=(user_context or {}).get("jlpt_level"))
+        try:
+            result = await chain.ainvoke(
+                self._chain_inputs(query, user_context, history)
+            )
+        except LLMUnavailable as e:
+            logger.warning(f"Serving fallback answer: {e}")
+            return self._fallback_response(user_context)
+        response_data = {
+            "response": result["answer"],
+            "sources": format_sources(result["docs"]),
+            "jlpt_level": (user_context or {}).get("jlpt_level"),
+        }
+        self._cache_store(cache_key, response_data)
+        await self._remember(session_id, query, response_data["response"])
+        return response_data
+
+    async def stream_response(self, query, user_context=None, course_id=None, conversation_history=None,
+                              session_id=None):
+        """
+        Streaming variant of generate_response. Yields ``(event, data)`` pairs:
+        ``("sources", [...])`` as soon as retrieval finishes, then ``("token", str)``
+        for each generated chunk, and finally ``("done", response_data)``.
+        """
+        history = await self._resolve_history(session_id, conversation_history)
+        cache_key, cached = await self._cache_lookup(query, user_context, course_id, history)
+        if cached is not None:
+            await self._remember(session_id, query, cached["response"])
+            yield "sources", cached["sources"]
+            yield "token", cached["response"]
+            yield "done", dict(cached, cached=True)
+            return
+
+        sources, tokens = [], []
+        chain = await self.aget_chain(course_id=course_id, jlpt_level=(user_context or {}).get("jlpt_level"))
+        try:
+            async for chunk in chain.astream(
+                self._chain_inputs(query, user_context, history)
+            ):
+                if "docs" in chunk:
+                    sources = format_sources(chunk["docs"])
+                    yield "sources", sources
+                if chunk.get("answer"):
+                    tokens.append(chunk["answer"])
+                    yield "token", chunk["answer"]
+        except LLMUnavailable as e:
+            logger.warning(f"Serving fallback answer: {e}")
+            response_data = self._fallback_response(user_context)
+            yield "token", response_data["response"]
+            yield "done", response_data
+            return
+
+        response_data = {
+            "response": "".join(tokens),
+            "sources": sources,
+            "jlpt_level": (user_context or {}).get("jlpt_level"),
+        }
+        self._cache_store(cache_key, response_data)
+        await self._remember(session_id, query, response_data["response"])
+        yield "done", response_data
+
+    async def _retrieve_quiz_material(self, topic, jlpt_level, k):
+        retrieval_filter = partition_filter(None, jlpt_level, by_jlpt=settings.RAG_FILTER_BY_JLPT)
+        retriever = await asyncio.to_thread(self.get_retriever, k, retrieval_filter)
+        return await retriever.ainvoke(topic)
+
+    async def _generate_quiz_questions(self, topic, difficulty, question_type, jlpt_level, num_questions,
+                                       docs=None, part=1):
+        """
+        Asks the LLM for up to ``num_questions`` new questions of one type,
+        grounded on ``docs`` (retrieved for the topic when not given).
+        """
+        bucket = quiz_bucket(topic, jlpt_level, difficulty, question_type)
+        if docs is None:
+            docs = await self._retrieve_quiz_material(topic, jlpt_level, settings.TOP_K_RETRIEVAL)
+        avoid = await asyncio.to_thread(self.quiz_bank.recent, bucket)
+        prompt = ChatPromptTemplate([("system", quiz_system_prompt), ("user", quiz_template)])
+        chain = prompt | self.llm | StrOutputParser()
+        reply = await chain.ainvoke({
+            "topic": topic,
+            "jlpt_level": jlpt_level or "any",
+            "difficulty": difficulty,
+            "question_type": question_type,
+            "num_questions": num_questions,
+            "part": part,
+            "avoid": "\n".join(f"- {q['question']}" for q in avoid) or "(none)",
+            "context": format_docs(docs),
+        })
+        return parse_quiz_questions(reply, question_type)[:num_questions]
+
+    async def _bank_questions(self, bucket, questions, served=False):
+        """Stores new questions in the quiz bank, dropping near-duplicates; returns the kept ones."""
+        if not questions:
+            return []
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(
+            self.embedding_executor,
+            lambda: self.embedding_model.embed_documents([question_text(q) for q in questions]),
+        )
+        return await asyncio.to_thread(self.quiz_bank.add, bucket, questions, vectors, served)
+
+    async def top_up_quiz_bank(self, topic, difficulty, question_type, jlpt_level, target=None):
+        """
+        Generates questions for one bucket until it holds ``target`` questions.
+        Stops early when a round adds nothing new (the topic is exhausted).
+        """
+        target = target or settings.QUIZ_BANK_TARGET
+        bucket = quiz_bucket(topic, jlpt_level, difficulty, question_type)
+        while True:
+            missing = target - await asyncio.to_thread(self.quiz_bank.count, bucket)
+            if missing <= 0:
+                return
+            questions = await self._generate_quiz_questions(
+                topic, difficulty, question_type, jlpt_level, min(missing, quiz_batch_size())
+            )
+            if not await self._bank_questions(bucket, questions):
+                logger.info(f"Quiz bank top-up for {bucket} stopped: no new questions")
+                return
+
+    def _schedule_quiz_top_up(self, topic, difficulty, question_type, jlpt_level):
+        bucket = quiz_bucket(topic, jlpt_level, difficulty, question_type)
+        if bucket in self._quiz_top_ups:
+            return
+        task = asyncio.create_task(self.top_up_quiz_bank(topic, difficulty, question_type, jlpt_level))
+        self._quiz_top_ups[bucket] = task
+
+        def done(task):
+            self._quiz_top_ups.pop(bucket, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Quiz bank top-up for {bucket} failed: {task.exception()}")
+
+        task.add_done_callback(done)
+
+    async def _generate_and_bank(self, topic, difficulty, question_type, jlpt_level, num_questions, docs, part):
+        questions = await self._generate_quiz_questions(
+            topic, difficulty, question_type, jlpt_level, num_questions, docs, part
+        )
+        return await self._bank_questions(quiz_bucket(topic, jlpt_level, difficulty, question_type), questions, served=True)
+
+    async def stream_quiz(self, topic, difficulty="medium", num_questions=10, question_types=None,
+                          jlpt_level=None, timeout=None):
+        """
+        Yields quiz questions as ``("question", question)`` events, then
+        ``("done", summary)``. Questions are split evenly over the question types
+        and served from the quiz bank first; the shortfall is generated by
+        concurrent LLM calls of at most quiz_batch_size() questions each
+        (replies sized to fit LLM_MAX_TOKENS), streamed as each call completes.
+        Calls still running at the ``timeout`` are cancelled and the quiz is
+        returned partial (``complete`` false). Each bucket is topped up in the
+        background afterwards. ``num_questions`` is clamped to QUIZ_MAX_QUESTIONS.
+        """
+        num_questions = max(0, min(num_questions, settings.QUIZ_MAX_QUESTIONS))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or settings.QUIZ_GENERATION_TIMEOUT)
+        question_types = question_types or ["multiple_choice"]
+        wanted = {
+            question_type: num_questions // len(question_types) + (i < num_questions % len(question_types))
+            for i, question_type in enumerate(question_types)
+        }
+        delivered = dict.fromkeys(wanted, 0)
+        from_bank = 0
+
+        for question_type, count in wanted.items():
+            if not count:
+                continue
+            served = await asyncio.to_thread(
+                self.quiz_bank.take, quiz_bucket(topic, jlpt_level, difficulty, question_type), count
+            )
+            from_bank += len(served)
+            delivered[question_type] = len(served)
+            for question in served:
+                yield "question", question
+
+        # One sub-request per batch of questions; each is grounded on its own
+        # share of the retrieved passages, i.e. on different grammar points
+        batch = quiz_batch_size()
+        calls = sum(-(-(wanted[t] - delivered[t]) // batch) for t in wanted)
+        material = []
+        if calls:
+            docs = await self._retrieve_quiz_material(topic, jlpt_level, max(settings.TOP_K_RETRIEVAL, calls))
+            groups = max(1, min(calls, len(docs)))
+            material = [docs[i::groups] for i in range(groups)]
+        owners, parts = {}, [0]
+
+        def launch(question_type):
+            shortfall = wanted[question_type] - delivered[question_type]
+            for start in range(0, shortfall, batch):
+                part = parts[0]
+                parts[0] += 1
+                task = asyncio.create_task(self._generate_and_bank(
+                    topic, difficulty, question_type, jlpt_level, min(batch, shortfall - start),
+                    material[part % len(material)], part + 1,
+                ))
+                owners[task] = question_type
+
+        for question_type in wanted:
+            launch(question_type)
+        pending = set(owners)
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning(f"Quiz generation timed out with {len(pending)} calls pending")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    question_type = owners.pop(task)
+                    try:
+                        fresh = task.result()
+                    except Exception as e:
+                        logger.warning(f"Quiz generation call failed: {e}")
+                        fresh = []
+                    fresh = fresh[:wanted[question_type] - delivered[question_type]]
+                    delivered[question_type] += len(fresh)
+                    for question in fresh:
+                        yield "question", question
+                    # Duplicates or short replies left a gap: retry while calls still make progress
+                    if fresh and not any(owner == question_type for owner in owners.values()):
+                        launch(question_type)
+                        pending |= {task for task, owner in owners.items() if owner == question_type}
+        finally:
+            for task in pending:
+                task.cancel()
+
+        for question_type, count in wanted.items():
+            if count:
+                self._schedule_quiz_top_up(topic, difficulty, question_type, jlpt_level)
+
+        yield "done", {
+            "topic": topic,
+            "difficulty": difficulty,
+            "jlpt_level": jlpt_level,
+            "num_questions": sum(delivered.values()),
+            "from_bank": from_bank,
+            "complete": all(delivered[t] >= wanted[t] for t in wanted),
+        }
+
+    async def generate_quiz(self, topic, difficulty="medium", num_questions=10, question_types=None,
+                            jlpt_level=None):
+        """
+        Non-streaming quiz: collects stream_quiz into one response.
+        """
+        questions, summary = [], {}
+        async for event, data in self.stream_quiz(topic, difficulty, num_questions, question_types, jlpt_level):
+            if event == "question":
+                questions.append(data)
+            else:
+                summary = data
+        return dict(summary, questions=questions)
+
+    async def _summarize(self, prompt_template, **inputs):
+        prompt = ChatPromptTemplate([("system", lesson_summary_system_prompt), ("user", prompt_template)])
+        chain = prompt | self.llm | StrOutputParser()
+        return (await chain.ainvoke(inputs)).strip()
+
+    async def generate_lesson_summary(self, content, target_level="intermediate", jlpt_level=None):
+        """
+        Summarizes lesson content for a learner level. Content longer than
+        SUMMARY_CHUNK_TOKENS is map-reduced: the parts are summarized
+        concurrently, then the partial summaries are combined (repeatedly, if
+        they are still too long for one call).
+        """
+        levels = {"target_level": target_level, "jlpt_level": jlpt_level or "any"}
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings.SUMMARY_CHUNK_TOKENS,
+            chunk_overlap=0,
+            separators=CHUNK_SEPARATORS,
+            keep_separator="end",
+            length_function=estimate_tokens,
+        )
+        parts = splitter.split_text(content)
+        if len(parts) <= 1:
+            return {"summary": await self._summarize(lesson_summary_template, content=content, **levels),
+                    "parts": 1, **levels}
+
+        partials = await asyncio.gather(*(
+            self._summarize(lesson_part_template, content=part, part=i + 1, total=len(parts), **levels)
+            for i, part in enumerate(parts)
+        ))
+        groups = splitter.split_text("\n\n".join(partials))
+        while len(groups) > 1:
+            partials = await asyncio.gather(*(
+                self._summarize(lesson_combine_template, content=group, **levels) for group in groups
+            ))
+            merged = splitter.split_text("\n\n".join(partials))
+            # Stop if combining no longer shrinks the text; the last call gets it all
+            groups = merged if len(merged) < len(groups) else ["\n\n".join(partials)]
+        summary = await self._summarize(lesson_combine_template, content=groups[0], **levels)
+        return {"summary": summary, "parts": len(parts), **levels}
+
+_rag_service = None
+_rag_service_lock = threading.Lock()
+
+def get_rag_service():
+    """
+    Returns the process-wide RAGService instance, creating it on first use.
+    """
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                _rag_service = RAGService()
+    return _rag_service
 
 # ------------------------------
 # 3. Document Parsing and Chunking
 # ------------------------------
 
-def parse_document(url, output_dir="outputs"):
+class DoclingError(RuntimeError):
+    """A docling conversion failed; the message carries the end of its stderr."""
+
+def _stderr_tail(stderr, max_chars=500):
+    return (stderr or "").strip()[-max_chars:] or "(no output)"
+
+def parse_document(url, output_dir="outputs", timeout=None, retries=None):
     """
     Downloads and converts a document from a URL to Markdown format using docling.
+    Each attempt runs in its own temporary directory, so conversions can run
+    concurrently. Failed or timed-out conversions are retried with backoff.
     Returns the path to the converted Markdown file.
     """
     os.makedirs(output_dir, exist_ok=True)
-    output_path = None
+    timeout = timeout or settings.DOCLING_TIMEOUT
+    retries = settings.DOCLING_RETRIES if retries is None else retries
 
-    os.makedirs("tmp")
-    subprocess.run(
-        ["docling", "--to", "md", "--pipeline", "vlm", "--vlm-model", "granite_docling", url, "--output", 'tmp'],
-        check=True
-    )
-    md_file = glob.glob(os.path.join('tmp', "*.md"))[0]
+    for attempt in range(retries + 1):
+        try:
+            with TemporaryDirectory(prefix="docling-") as tmp_dir:
+                result = subprocess.run(
+                    ["docling", "--to", "md", "--pipeline", "vlm", "--vlm-model", "granite_docling", url, "--output", tmp_dir],
+                    timeout=timeout,
+                    capture_output=True,
+                    text=True,
+                )
+                if result.returncode != 0:
+                    raise DoclingError(f"docling exited with {result.returncode}: {_stderr_tail(result.stderr)}")
+                md_files = glob.glob(os.path.join(tmp_dir, "*.md"))
+                if not md_files:
+                    raise DoclingError(f"docling produced no Markdown: {_stderr_tail(result.stderr)}")
+                # Prefix with the URL hash: different pages often share a basename
+                output_path = os.path.join(output_dir, f"{content_hash(url)[:12]}-{os.path.basename(md_files[0])}")
+                shutil.move(md_files[0], output_path)
+                return output_path
+        except (DoclingError, subprocess.TimeoutExpired) as e:
+            if attempt == retries:
+                raise DoclingError(f"Converting {url} failed: {e}") from e
+            logger.warning(f"docling failed for {url} (attempt {attempt + 1}/{retries + 1}): {e}")
+            time.sleep(2 ** attempt)
+
+def parse_documents(urls, output_dir="outputs", max_workers=None, timeout=None, retries=None, inputs=None):
+    """
+    Converts many documents concurrently. Each docling conversion is its own
+    OS process loading its own models, so the pool (DOCLING_MAX_WORKERS)
+    bounds how many run at once and with them peak memory. ``inputs`` may map
+    a URL to a local copy (e.g. crawler cache) to convert instead.
+    Returns {url: markdown path} for successes and {url: exception} for failures.
+    """
+    inputs = inputs or {}
+    max_workers = max_workers or settings.DOCLING_MAX_WORKERS
+    converted, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="docling") as pool:
+        futures = {
+            pool.submit(parse_document, inputs.get(url, url), output_dir, timeout, retries): url
+            for url in urls
+        }
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                converted[url] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to convert {url}: {e}")
+                failed[url] = e
+    return converted, failed
+
+HEADERS_TO_SPLIT_ON = [
+    ("###", "h3"),
+    ("####", "h4")
+]
+
+# Japanese sentence/clause boundaries come before the character fallback
+CHUNK_SEPARATORS = ["\n\n", "\n", "。", "！", "？", "、", " ", ""]
 
-    output_path = os.path.join(output_dir, os.path.basename(md_file))
-    shutil.move(md_file, output_path)
-    shutil.rmtree('tmp/')
-    return output_path
+def iter_markdown_sections(file_path, headers_to_split_on=HEADERS_TO_SPLIT_ON):
+    """
+    Streams a Markdown file line by line and yields ``(metadata, text)`` for
+    each section between the configured headers. ``metadata`` carries the
+    enclosing header titles, like MarkdownHeaderTextSplitter.
+    """
+    levels = sorted(headers_to_split_on, key=lambda h: len(h[0]), reverse=True)
+    depth = {name: len(marker) for marker, name in headers_to_split_on}
+    current, lines = {}, []
+    in_code = False
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.lstrip().startswith("```"):
+                in_code = not in_code
+            header = None
+            if not in_code:
+                header = next(((m, n) for m, n in levels if line.startswith(m + " ")), None)
+            if header is None:
+                lines.append(line)
+                continue
+            text = "".join(lines).strip()
+            if text:
+                yield dict(current), text
+            lines = []
+            marker, name = header
+            # A header closes every section at its level or deeper
+            current = {k: v for k, v in current.items() if depth[k] < len(marker)}
+            current[name] = line[len(marker):].strip()
+    text = "".join(lines).strip()
+    if text:
+        yield dict(current), text
+
+def chunk_size_histogram(chunks, bins=8, chunk_size=None):
+    """
+    Counts chunks per size bucket (characters), e.g. {"0-64": 3, "64-128": 10, ...}.
+    """
+    chunk_size = chunk_size or settings.CHUNK_SIZE
+    width = max(chunk_size // bins, 1)
+    histogram = {f"{i * width}-{(i + 1) * width}": 0 for i in range(bins)}
+    histogram[f">{bins * width}"] = 0
+    for chunk in chunks:
+        bucket = len(chunk.page_content) // width
+        key = f"{bucket * width}-{(bucket + 1) * width}" if bucket < bins else f">{bins * width}"
+        histogram[key] += 1
+    return histogram
 
-def chunk_document(file_path):
+def chunk_document(file_path, chunk_size=None, chunk_overlap=None):
     """
-    Splits a Markdown document into chunks based on header levels.
+    Splits a Markdown document into chunks in two stages: header sections
+    first, then RecursiveCharacterTextSplitter bounds every chunk to
+    CHUNK_SIZE characters with CHUNK_OVERLAP. The file is streamed, not read whole.
     Returns a list of document chunks.
     """
-    headers_to_split_on = [
-        ("###", "h3"),
-        ("####", "h4")
-    ]
-    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-    # Read file
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,
+        separators=CHUNK_SEPARATORS,
+        keep_separator="end",  # 。！？ stay with the sentence they end
+    )
     chunks = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        markdown_text = f.read()
-        chunks = md_splitter.split_text(markdown_text)[1:-1]
+    for metadata, text in iter_markdown_sections(file_path):
+        for piece in text_splitter.split_text(text):
+            chunks.append(Document(page_content=piece, metadata=dict(metadata)))
+
+    logger.info(f"Chunked {file_path} into {len(chunks)} chunks, sizes: {chunk_size_histogram(chunks)}")
     return chunks
 
 # ------------------------------
 # 4. Vector Store Indexing and Retrieval
 # ------------------------------
 
-def index_chunks(persist_dir, chunks, embedding_model):
+def rebuild_sparse_index(vector_db, sparse_index):
+    """
+    Fills ``sparse_index`` from every chunk stored in the vector database.
+    """
+    stored = vector_db.get(include=["documents", "metadatas"])
+    if stored["ids"]:
+        logger.info(f"Building sparse index from {len(stored['ids'])} stored chunks")
+        sparse_index.add(stored["ids"], [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(stored["documents"], stored["metadatas"])
+        ])
+        sparse_index.save()
+    return sparse_index
+
+def chunk_tags(source, metadata=None):
+    """Metadata every chunk of ``source`` is tagged with: its partition, ``metadata`` and the source."""
+    return {**partition_metadata(), **(metadata or {}), "source": source}
+
+def index_chunks(persist_dir, chunks, embedding_model, source=None, document_hash=None, metadata=None):
     """
-    Indexes document chunks into a Chroma vector store.
-    If the store exists, adds new documents; otherwise, creates a new store.
+    Incrementally indexes the chunks of one source document into the vector store.
+
+    Chunk ids are content hashes scoped to ``source``, and the ingestion
+    manifest remembers which ids each source produced: an unchanged document
+    is skipped, only new chunks are embedded and stale chunks are deleted.
+    The BM25 sparse index is kept in sync with the same ids. Every chunk is
+    tagged with ``source`` and its partition (course_id, jlpt_level), merged
+    with ``metadata``. Writers are serialized by index_write_lock, so
+    concurrent ingestion jobs do not overwrite each other's entries.
     Returns the vector database object.
     """
-    chroma_exists = os.path.exists(persist_dir)
+    with index_write_lock(persist_dir):
+        return _index_chunks(persist_dir, chunks, embedding_model, source, document_hash, metadata)
 
-    if chroma_exists:
-        print("🟡 Existing Chroma vector store found — adding new documents...")
-        vector_db = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=embedding_model,
-        )
-        vector_db.add_documents(chunks)
-    else:
-        print("🆕 No existing Chroma DB found — creating a new one...")
-        docs_ids = [str(i) for i in range(len(chunks))]
-        vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embedding_model,
-            persist_directory=persist_dir,
-            ids=docs_ids,
-        )
+def remove_sources(persist_dir, embedding_model, sources):
+    """
+    Deletes every chunk of ``sources`` from the vector store and the sparse
+    index and drops their manifest entries, e.g. for syllabus pages that a
+    re-crawl no longer lists. Returns the number of chunks removed.
+    """
+    with index_write_lock(persist_dir):
+        manifest = IngestionManifest(persist_dir)
+        sources = [source for source in sources if source in manifest.sources()]
+        if not sources:
+            return 0
+        ids = [i for source in sources for i in manifest.chunk_ids(source)]
+        vector_db = open_vector_store(persist_dir, embedding_model)
+        sparse_index = SparseIndex(persist_dir)
+        if ids:
+            vector_db.delete(ids=ids)
+            sparse_index.delete(ids)
+            _compact_if_needed(vector_db)
+            vector_db.persist()
+            sparse_index.save()
+        for source in sources:
+            manifest.remove(source)
+        manifest.save()
+    logger.info(f"Removed {len(sources)} sources ({len(ids)} chunks)")
+    return len(ids)
+
+def _compact_if_needed(vector_db):
+    # HNSW cannot delete: re-ingestion leaves tombstones until the index is rebuilt
+    tombstones = vector_db.tombstone_ratio if settings.VECTOR_STORE_BACKEND == "faiss" else 0.0
+    if tombstones > settings.FAISS_COMPACT_TOMBSTONE_RATIO:
+        logger.info(f"Compacting FAISS index ({tombstones:.0%} tombstones)")
+        vector_db.compact()
+
+def _index_chunks(persist_dir, chunks, embedding_model, source, document_hash, metadata):
+    source = source or (chunks[0].metadata.get("source", "") if chunks else "")
+    vector_db = open_vector_store(persist_dir, embedding_model)
+    if not source:
+        # Nothing to key the manifest entry on: record no placeholder source
+        logger.warning(f"Skipping {len(chunks)} chunks without a source")
+        return vector_db
+    tags = chunk_tags(source, metadata)
+    manifest = IngestionManifest(persist_dir)
+
+    current = {}
+    for chunk in chunks:
+        chunk.metadata.update(tags)
+        digest = chunk_hash(chunk)
+        current[chunk_id(source, digest)] = (digest, chunk)
+    chunk_hashes = {i: digest for i, (digest, _) in current.items()}
+
+    # Tags are part of the document hash so re-tagging re-indexes the document
+    document_hash = content_hash(
+        (document_hash or "".join(sorted(h for h, _ in current.values())))
+        + json.dumps(tags, sort_keys=True, ensure_ascii=False)
+    )
+    if manifest.is_unchanged(source, document_hash):
+        if manifest.tags(source) != tags:
+            # Entry written before tags were recorded
+            manifest.record(source, document_hash, chunk_hashes, tags)
+            manifest.save()
+        logger.info(f"Unchanged, skipping: {source}")
+        return vector_db
+
+    previous_ids = set(manifest.chunk_ids(source))
+    new_ids = [i for i in current if i not in previous_ids]
+    stale_ids = [i for i in previous_ids if i not in current]
+
+    sparse_index = SparseIndex(persist_dir)
+    if stale_ids:
+        vector_db.delete(ids=stale_ids)
+        sparse_index.delete(stale_ids)
+    if new_ids:
+        new_chunks = [current[i][1] for i in new_ids]
+        vector_db.add_documents(new_chunks, ids=new_ids)
+        sparse_index.add(new_ids, new_chunks)
+
+    _compact_if_needed(vector_db)
 
     # Save / persist to disk
     vector_db.persist()
-    print(f"✅ Vector store ready at: {persist_dir}")
+    sparse_index.save()
+
+    manifest.record(source, document_hash, chunk_hashes, tags)
+    manifest.save()
+    logger.info(
+        f"Indexed {source}: {len(new_ids)} added, {len(stale_ids)} removed, "
+        f"{len(current) - len(new_ids)} unchanged"
+    )
     return vector_db
 
-def load_document(url, output_dir, persist_dir, embedding_model):
+def index_document(md_path, url, persist_dir, embedding_model, metadata=None):
+    """
+    Chunks an already converted Markdown file and indexes it under ``url``.
+    ``metadata`` (e.g. partition_metadata(course_id, jlpt_level)) tags every chunk.
+    Returns the vector database object.
+    """
+    with open(md_path, "r", encoding="utf-8") as f:
+        document_hash = content_hash(f.read())
+    chunks = chunk_document(md_path)
+    return index_chunks(persist_dir, chunks, embedding_model, source=url, document_hash=document_hash, metadata=metadata)
+
+def load_document(url, output_dir, persist_dir, embedding_model, metadata=None):
     """
     Loads a document from a URL, chunks it, indexes it, and returns a retriever object.
     """
     doc = parse_document(url, output_dir)
-    chunks = chunk_document(doc)
-    vector_db = index_chunks(persist_dir, chunks, embedding_model)
-    retriever = vector_db.as_retriever(search_kwargs={"k": 3})
+    vector_db = index_document(doc, url, persist_dir, embedding_model, metadata)
+    retriever = vector_db.as_retriever(search_kwargs={"k": settings.TOP_K_RETRIEVAL})
     return retriever
 
 # ------------------------------
 # 5. Syllabus Extraction from HTML (EXAMPLE)
 # ------------------------------
 
-def get_syllabus(url):
+def make_crawler():
+    """
+    Crawler configured from settings (pooled client, politeness, HTML cache).
+    """
+    return SyllabusCrawler(
+        settings.CRAWL_CACHE_DIR,
+        max_concurrency=settings.CRAWL_CONCURRENCY,
+        min_interval=settings.CRAWL_MIN_INTERVAL,
+        timeout=settings.CRAWL_TIMEOUT,
+    )
+
+def get_syllabus(url, crawler=None):
     """
     Extracts syllabus links from a given HTML page using BeautifulSoup.
     Returns a list of dictionaries with 'title' and 'url' for each lesson.
     """
-    response = requests.get(url)
-    html = response.text
+    if crawler is None:
+        with make_crawler() as crawler:
+            return get_syllabus(url, crawler)
+    html = crawler.fetch(url).html
 
     # parse with BeautifulSoup
     soup = BeautifulSoup(html, "lxml")
@@ -172,37 +1096,182 @@ def get_syllabus(url):
     links = soup.select("dd a")
 
     # extract text and href
-    data = [{"title": link.get_text(strip=True), "url": link["href"]} for link in links]
+    data = [{"title": link.get_text(strip=True), "url": urljoin(url, link["href"])} for link in links]
 
     return data
 
-# Example usage: Extract syllabus and index first 40 lessons
-syllabus = get_syllabus("https://wasabi-jpn.com/magazine/japanese-grammar/wasabis-online-japanese-grammar-reference/?lang=en")
-urls = []
-for lesson in syllabus:
-    urls.append(lesson['url'])
-retriever = None
-for i in range(40):
-    retriever = load_document(urls[i], '/kaggle/working/syllybus', 'test3', embedding_model)
-
 # ------------------------------
 # 6. RAG Chain Initialization and Querying
 # ------------------------------
 
-chat_history = [] # should be per session <TEMP>
+# Bump whenever either prompt below changes so cached chains are rebuilt.
+PROMPT_VERSION = "2"
+
+NO_ANSWER = "NO ANSWER IS AVAILABLE"
+
+LLM_BUSY_ANSWER = (
+    "The AI teacher is answering a lot of questions right now. "
+    "Please ask again in a moment."
+)
+
+history_summary_prompt = """
+You maintain a running summary of a conversation between a student and a
+Japanese teacher. Merge the new exchanges into the current summary. Keep the
+grammar points, vocabulary and questions discussed and what the student
+struggled with. Answer with the updated summary only, in at most 120 words.
+"""
+
+contextualize_q_system_prompt = """
+Given a chat history and the latest user question
+which might reference context in the chat history,
+formulate a standalone question which can be understood
+without the chat history. Do NOT answer the question,
+just reformulate it if needed and otherwise return it as is.
+"""
+
+user_template = '\n'.join([
+    "Answer the next question using the provided context",
+    "If the answer is not contained in the context, say 'NO ANSWER IS AVAILABLE'",
+    "### Context:",
+    "{context}",
+    "",
+    "### Learner:",
+    "{learner}",
+    "",
+    "### Chat History",
+    "{history}",
+    "",
+    "### Question:",
+    "{input}",
+    "",
+    "### Answer:"
+])
+
+quiz_system_prompt = """
+You write Japanese language quiz questions for learners. Base them on the
+reference material when it is relevant. Reply with a JSON array only, no
+other text. Each item is an object with the keys "type", "question",
+"options" (a list of 4 choices for multiple_choice, otherwise omitted),
+"answer" and "explanation".
+"""
+
+quiz_template = '\n'.join([
+    "Topic: {topic}",
+    "JLPT level: {jlpt_level}",
+    "Difficulty: {difficulty}",
+    "Question type: {question_type}",
+    "Number of questions: {num_questions}",
+    "Question set: {part}",
+    "",
+    "### Do not repeat these questions:",
+    "{avoid}",
+    "",
+    "### Reference material:",
+    "{context}",
+])
+
+# Bump whenever a lesson summary prompt changes; part of the summary cache key.
+SUMMARY_PROMPT_VERSION = "1"
+
+lesson_summary_system_prompt = """
+You are a Japanese language teacher writing lesson summaries for learners.
+Keep the Japanese examples, grammar patterns and vocabulary of the lesson.
+"""
+
+lesson_summary_template = '\n'.join([
+    "Summarize the lesson below for a {target_level} learner (JLPT level: {jlpt_level}).",
+    "List the key grammar points and vocabulary, then give a short overview.",
+    "",
+    "### Lesson:",
+    "{content}",
+])
+
+lesson_part_template = '\n'.join([
+    "This is part {part} of {total} of a lesson. Summarize this part only,",
+    "keeping every grammar point, vocabulary item and example it introduces.",
+    "",
+    "### Lesson part:",
+    "{content}",
+])
+
+lesson_combine_template = '\n'.join([
+    "Below are summaries of consecutive parts of one lesson. Combine them into one",
+    "summary for a {target_level} learner (JLPT level: {jlpt_level}): list the key",
+    "grammar points and vocabulary without repetition, then give a short overview.",
+    "",
+    "### Part summaries:",
+    "{content}",
+])
+
+def parse_quiz_questions(text, question_type):
+    """
+    Extracts the question objects from an LLM reply one by one, tolerating
+    code fences, surrounding prose and a reply cut off mid-array: every
+    complete question is kept, malformed or truncated items are dropped.
+    """
+    decoder = json.JSONDecoder()
+    position = text.find("[") + 1
+    questions = []
+    while True:
+        position = text.find("{", position)
+        if position == -1:
+            return questions
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position += 1
+            continue
+        if isinstance(item, dict) and item.get("question") and item.get("answer") is not None:
+            item["type"] = question_type
+            questions.append(item)
+
+def quiz_batch_size():
+    """Questions per LLM call: QUIZ_GENERATION_BATCH, capped so the reply fits in LLM_MAX_TOKENS."""
+    return max(1, min(settings.QUIZ_GENERATION_BATCH, settings.LLM_MAX_TOKENS // settings.QUIZ_TOKENS_PER_QUESTION))
 
-def init_rag(chat_history):
+def format_docs(docs):
+    """
+    Formats retrieved documents for context presentation, packed best-first
+    and deduplicated within CONTEXT_TOKEN_BUDGET.
+    """
+    return pack_context(docs, settings.CONTEXT_TOKEN_BUDGET, settings.CONTEXT_DEDUP_THRESHOLD)
+
+def format_sources(docs):
+    """
+    Summarizes retrieved documents for API responses.
+    """
+    return [{"content": doc.page_content[:200], "metadata": doc.metadata} for doc in docs]
+
+def format_history(messages):
+    """
+    Renders chat history messages as plain text for the Q&A prompt.
+    """
+    lines = []
+    for message in messages or []:
+        if isinstance(message, SystemMessage):
+            speaker = "Summary"
+        else:
+            speaker = "Student" if isinstance(message, HumanMessage) else "Teacher"
+        lines.append(f"{speaker}: {message.content}")
+    return "\n".join(lines)
+
+def format_user_context(user_context):
+    """
+    Renders the learner profile (JLPT level, preferences, role) for the prompt.
+    """
+    if not user_context:
+        return ""
+    return "\n".join(f"{key}: {value}" for key, value in user_context.items() if value)
+
+def init_rag(llm, retriever):
     """
     Initializes the RAG chain with history-aware retrieval and a Q&A prompt.
+    The chain holds no per-request state: it expects ``input``, ``chat_history``
+    (list of messages) and optionally ``user_context`` as inputs, and returns a
+    dict with the retrieved ``docs`` and the generated ``answer``.
     Returns the RAG chain object.
     """
-    contextualize_q_system_prompt = """
-    Given a chat history and the latest user question
-    which might reference context in the chat history,
-    formulate a standalone question which can be understood
-    without the chat history. Do NOT answer the question,
-    just reformulate it if needed and otherwise return it as is.
-    """
+    from langchain.chains import create_history_aware_retriever
 
     contextualize_q_prompt = ChatPromptTemplate(
         [
@@ -216,58 +1285,64 @@ def init_rag(chat_history):
         llm, retriever, contextualize_q_prompt
     )
 
-    user_template = '\n'.join([
-        "Answer the next question using the provided context",
-        "If the answer is not contained in the context, say 'NO ANSWER IS AVAILABLE'",
-        "### Context:",
-        "{context}",
-        "",
-        "### Chat History",
-        "{chat_history}",
-        "",
-        "### Question:",
-        "{input}",
-        "",
-        "### Answer:"
-    ])
-
     qna_prompt = ChatPromptTemplate([
         ("system", "You are a japanese language teacher."),
         ("user", user_template)
     ])
 
-    def format_docs(docs):
-        """
-        Formats retrieved documents for context presentation.
-        """
-        return "\n----------\n".join(doc.page_content for doc in docs)
-
     llm_chain = qna_prompt | llm | StrOutputParser()
-    rag_chain = {"context": history_aware_retriever | format_docs, "input": RunnablePassthrough(), 'chat_history': RunnablePassthrough()} | llm_chain
+    rag_chain = RunnablePassthrough.assign(
+        docs=history_aware_retriever
+    ).assign(
+        context=lambda x: format_docs(x["docs"]),
+        history=lambda x: format_history(x.get("chat_history")),
+        learner=lambda x: format_user_context(x.get("user_context")),
+    ).assign(
+        answer=llm_chain
+    )
     return rag_chain
 
-def query_rag(session_id, query):
+def query_rag(session_id, query, chat_history=None, user_context=None):
     """
     Queries the RAG chain with a user question and session chat history.
     Returns the model's response.
     """
-    # chat_history = get_chat_history(session_id)
-    chat_history = []
-    model = init_rag(chat_history)
-    response = model.invoke({'input':query, 'chat_history': chat_history})
-    # update_chat_history(session_id, query, response)
-    return response
+    if chat_history is None:
+        chat_history = get_chat_history(session_id)
+    chain = get_rag_service().get_chain()
+    result = chain.invoke({
+        'input': query,
+        'chat_history': chat_history,
+        'user_context': user_context,
+    })
+    update_chat_history(session_id, query, result["answer"])
+    return result["answer"]
 
 # ------------------------------
 # 7. Chat History Management
 # ------------------------------
 
+def get_chat_history(session_id):
+    """
+    Returns the bounded history (rolling summary + recent turns) for a session.
+    """
+    return get_rag_service().history_store.get_messages(session_id)
+
 def update_chat_history(session_id, query, response):
     """
     Updates the chat history for a session with the latest user query and model response.
     """
-    # add_row to the table
-    chat_history.extend([
-        HumanMessage(query),
-        AIMessage(response)
-    ])
\ No newline at end of file
+    get_rag_service().history_store.append(session_id, query, response)
+
+def history_to_messages(conversation_history):
+    """
+    Converts client-supplied history ([{"role": ..., "content": ...}]) to chat messages.
+    """
+    messages = []
+    for turn in conversation_history or []:
+        content = turn.get("content") or turn.get("message") or ""
+        if turn.get("role") in ("assistant", "ai"):
+            messages.append(AIMessage(content))
+        else:
+            messages.append(HumanMessage(content))
+    return messages
@@ -0,0 +1,73 @@
+"""
+Cross-encoder re-ranking under a latency budget.
+
+A wider candidate set is retrieved first; a small CPU cross-encoder then
+scores (query, passage) pairs in batches, best-first by the original ranking,
+and stops scoring once the time budget is spent. Scored passages are ordered
+by score ahead of unscored ones, so a tight budget degrades gracefully to the
+original retrieval order. Only the top ``top_n`` reach the prompt.
+"""
+import logging
+import threading
+import time
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, batch_size: int = 8, budget_ms: float = 150.0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self._model = None
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "budget_exhausted": 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading re-ranker {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def rerank(self, query: str, docs: List[Document], top_n: int) -> List[Document]:
+        if len(docs) <= 1:
+            return docs[:top_n]
+        model = self.model
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        scored = []
+        for start in range(0, len(docs), self.batch_size):
+            batch = docs[start:start + self.batch_size]
+            scores = model.predict([(query, doc.page_content) for doc in batch], batch_size=self.batch_size)
+            scored.extend(zip(batch, (float(s) for s in scores)))
+            if time.perf_counter() > deadline:
+                break
+
+        self.stats["queries"] += 1
+        if len(scored) < len(docs):
+            self.stats["budget_exhausted"] += 1
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        ranked = []
+        for doc, score in scored:
+            ranked.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score}))
+        ranked.extend(docs[len(scored):])
+        return ranked[:top_n]
+
+
+class RerankingRetriever(BaseRetriever):
+    """Retrieves candidates with ``base`` and keeps the ``top_n`` best after re-ranking."""
+
+    base: BaseRetriever
+    reranker: Any
+    top_n: int = 3
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.reranker.rerank(query, self.base.invoke(query), self.top_n)
@@ -0,0 +1,77 @@
+"""
+Semantic response cache for first-turn chat questions.
+
+Answers are stored together with the normalized embedding of the question.
+A new question is served from the cache when its cosine similarity to a cached
+question in the same partition (course, learner profile, collection version)
+is at least the configured threshold. Entries expire after a TTL and the least
+recently used ones are evicted once the cache is full.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    def __init__(self, threshold: float = 0.95, ttl: int = 86400, maxsize: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # (partition, entry id) -> (unit vector, response, expires_at)
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, partition: Hashable, vector: List[float]) -> Optional[Dict[str, Any]]:
+        """Returns the cached response of the most similar question, if close enough."""
+        query = self._unit(vector)
+        now = time.time()
+        best_key, best_score = None, self.threshold
+        with self._lock:
+            for key, (cached, _, expires_at) in list(self._entries.items()):
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                if key[0] != partition:
+                    continue
+                score = float(np.dot(query, cached))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return dict(self._entries[best_key][1], cache_similarity=round(best_score, 4))
+
+    def store(self, partition: Hashable, vector: List[float], response: Dict[str, Any]):
+        with self._lock:
+            self._entries[(partition, self._next_id)] = (self._unit(vector), response, time.time() + self.ttl)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "threshold": self.threshold,
+        }
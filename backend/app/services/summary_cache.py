@@ -0,0 +1,60 @@
+"""
+Content-addressed cache for generated lesson summaries, stored in the
+database. The key covers everything that determines the output: the lesson
+text (hashed after normalization), target level, JLPT level, summary prompt
+version and LLM model. Unchanged lessons are never summarized twice.
+Functions are blocking; call them via run_in_threadpool.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+
+from app.db.database import SessionLocal
+from app.models.lesson_summary import LessonSummary
+from app.services.embedding_cache import normalize_text
+from app.services.ingestion_manifest import content_hash
+from app.services.llm_backends import llm_model_name
+from app.services.rag_service import SUMMARY_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def summary_key(content: str, target_level: str, jlpt_level: Optional[str]) -> Dict[str, Any]:
+    parts = {
+        "content_hash": content_hash(normalize_text(content)),
+        "target_level": target_level,
+        "jlpt_level": jlpt_level,
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        "llm_model": llm_model_name(),
+    }
+    parts["cache_key"] = hashlib.sha256("\0".join(str(v) for v in parts.values()).encode("utf-8")).hexdigest()
+    return parts
+
+
+def get_cached_summary(key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        row = db.query(LessonSummary).filter(LessonSummary.cache_key == key["cache_key"]).first()
+        if row is None:
+            return None
+        row.hits = (row.hits or 0) + 1
+        row.last_used_at = func.now()
+        db.commit()
+        return row.summary
+    finally:
+        db.close()
+
+
+def store_summary(key: Dict[str, Any], summary: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        db.add(LessonSummary(**key, summary=summary))
+        db.commit()
+    except IntegrityError:
+        # Another request stored the same summary first
+        db.rollback()
+    finally:
+        db.close()
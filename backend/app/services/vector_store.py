@@ -0,0 +1,362 @@
+"""
+Pluggable vector-store layer.
+
+``open_vector_store`` returns the backend selected by ``settings.VECTOR_STORE_BACKEND``:
+
+- ``chroma``: LangChain's Chroma with its SQLite persistence (default).
+- ``faiss``: FaissVectorStore, an in-process ANN index (HNSW or exact flat).
+  Where the installed faiss can memory-map the vectors of these index types
+  (``IO_FLAG_MMAP_IFC``) the index file is mapped read-only at startup, so
+  loading is zero-copy and several workers share the same pages; older faiss
+  builds read it into memory. Texts and metadata live in a SQLite docstore
+  next to it. Both backends expose the subset of the
+  Chroma API used by ingestion (``add_documents(ids=)``, ``delete(ids=)``,
+  ``get()``, ``persist()``) and ``as_retriever``.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.core.config import settings
+from app.services.ingestion_manifest import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Partition metadata carried by every chunk. Shared material (e.g. the grammar
+# syllabus) belongs to GLOBAL_COURSE and is visible from every course.
+GLOBAL_COURSE = "global"
+ANY_LEVEL = "any"
+JLPT_LEVELS = ["N5", "N4", "N3", "N2", "N1"]  # easiest first
+
+FAISS_SUBDIR = "faiss"
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite3"
+
+
+def partition_metadata(course_id=None, jlpt_level=None) -> Dict[str, str]:
+    """Metadata tagging a chunk with its course and JLPT level."""
+    return {
+        "course_id": str(course_id) if course_id is not None else GLOBAL_COURSE,
+        "jlpt_level": jlpt_level or ANY_LEVEL,
+    }
+
+
+def partition_filter(course_id=None, jlpt_level=None, by_jlpt=False) -> Dict[str, List[str]]:
+    """
+    Retrieval filter as {metadata field: allowed values}: the course's own
+    chunks plus shared ones, and optionally only material at or below the
+    learner's JLPT level.
+    """
+    courses = [GLOBAL_COURSE] + ([str(course_id)] if course_id is not None else [])
+    retrieval_filter = {"course_id": courses}
+    if by_jlpt and jlpt_level in JLPT_LEVELS:
+        retrieval_filter["jlpt_level"] = JLPT_LEVELS[:JLPT_LEVELS.index(jlpt_level) + 1] + [ANY_LEVEL]
+    return retrieval_filter
+
+
+def matches_filter(metadata: Dict, retrieval_filter: Optional[Dict[str, List[str]]]) -> bool:
+    return not retrieval_filter or all(
+        metadata.get(field) in allowed for field, allowed in retrieval_filter.items()
+    )
+
+
+def to_chroma_filter(retrieval_filter: Optional[Dict[str, List[str]]]) -> Optional[Dict]:
+    """Translates a partition filter to Chroma's where-clause syntax."""
+    if not retrieval_filter:
+        return None
+    clauses = [{field: {"$in": allowed}} for field, allowed in retrieval_filter.items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class FaissVectorStore(VectorStore):
+    """
+    FAISS index of normalized vectors (inner product = cosine similarity).
+
+    Vectors are keyed by int64 ids mapped to the string chunk ids in the
+    docstore. Deletion removes vectors where the index supports it and
+    otherwise (HNSW) leaves tombstones that searches skip; ``compact()``
+    rebuilds the index without them, which ingestion triggers once they
+    exceed FAISS_COMPACT_TOMBSTONE_RATIO of the index.
+    """
+
+    def __init__(self, persist_dir: str, embedding: Embeddings, index_type: str = "hnsw",
+                 hnsw_m: int = 32, mmap: bool = True):
+        self.persist_dir = os.path.join(persist_dir, FAISS_SUBDIR)
+        self.embedding = embedding
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.mmap = mmap
+        self._lock = threading.RLock()
+        self._index = None
+        self._writable = False
+        self._mtime = None
+        self._tombstones = 0
+
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.persist_dir, DOCSTORE_FILENAME), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "int_id INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._load(writable=False)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.persist_dir, INDEX_FILENAME)
+
+    # -- index lifecycle --
+
+    def _load(self, writable: bool):
+        import faiss
+
+        with self._lock:
+            if not os.path.exists(self._index_path):
+                self._index, self._writable, self._mtime = None, True, None
+                return
+            # IO_FLAG_MMAP only maps IVF inverted lists; flat and HNSW vectors
+            # need IO_FLAG_MMAP_IFC (faiss >= 1.11), otherwise they are read into memory
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None) if self.mmap and not writable else None
+            if mmap_flag is not None:
+                try:
+                    self._index = faiss.read_index(self._index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError:
+                    mmap_flag = None
+            if mmap_flag is None:
+                self._index = faiss.read_index(self._index_path)
+            self._writable = mmap_flag is None
+            self._mtime = os.stat(self._index_path).st_mtime_ns
+            self._tombstones = max(self._index.ntotal - self._count(), 0)
+
+    def refresh(self):
+        """Reloads the index if another process (e.g. ingestion) rewrote it."""
+        if os.path.exists(self._index_path) and os.stat(self._index_path).st_mtime_ns != self._mtime:
+            self._load(writable=False)
+
+    def _ensure_writable(self, dim: int):
+        import faiss
+
+        if self._index is not None and not self._writable:
+            self._load(writable=True)
+        if self._index is None:
+            if self.index_type == "flat":
+                base = faiss.IndexFlatIP(dim)
+            else:
+                base = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            self._index = faiss.IndexIDMap2(base)
+            self._writable = True
+
+    def persist(self):
+        import faiss
+
+        with self._lock:
+            if self._index is None or not self._writable:
+                return
+            tmp_path = self._index_path + ".tmp"
+            faiss.write_index(self._index, tmp_path)
+            os.replace(tmp_path, self._index_path)
+            self._mtime = os.stat(self._index_path).st_mtime_ns
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # -- writes --
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        array = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(array, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return array / norms
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [content_hash(text) for text in texts]
+        vectors = self._normalize(self.embedding.embed_documents(texts))
+
+        with self._lock:
+            self.delete(ids=[i for i in ids if self._int_id(i) is not None])
+            self._ensure_writable(vectors.shape[1])
+            int_ids = []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                cursor = self._db.execute(
+                    "INSERT INTO docs (id, text, metadata) VALUES (?, ?, ?)",
+                    (doc_id, text, json.dumps(metadata, ensure_ascii=False, default=str)),
+                )
+                int_ids.append(cursor.lastrowid)
+            self._index.add_with_ids(vectors, np.asarray(int_ids, dtype=np.int64))
+            self._db.commit()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return True
+        with self._lock:
+            int_ids = [i for i in (self._int_id(doc_id) for doc_id in ids) if i is not None]
+            if not int_ids:
+                return True
+            if self._index is not None:
+                self._ensure_writable(self._index.d)
+                try:
+                    self._index.remove_ids(np.asarray(int_ids, dtype=np.int64))
+                except RuntimeError:
+                    # HNSW cannot remove vectors: searches skip ids missing from the docstore
+                    self._tombstones += len(int_ids)
+            self._db.executemany("DELETE FROM docs WHERE int_id = ?", [(i,) for i in int_ids])
+            self._db.commit()
+        return True
+
+    @property
+    def tombstone_ratio(self) -> float:
+        if self._index is None or not self._index.ntotal:
+            return 0.0
+        return self._tombstones / self._index.ntotal
+
+    def compact(self):
+        """Rebuilds the index without tombstoned vectors."""
+        with self._lock:
+            if self._index is None or not self._tombstones:
+                return
+            self._ensure_writable(self._index.d)
+            int_ids = [row[0] for row in self._db.execute("SELECT int_id FROM docs")]
+            vectors = np.vstack([self._index.reconstruct(i) for i in int_ids]) if int_ids else None
+            old = self._index
+            self._index = None
+            self._ensure_writable(old.d)
+            if vectors is not None:
+                self._index.add_with_ids(vectors, np.asarray(int_ids, dtype=np.int64))
+            self._tombstones = 0
+
+    def _int_id(self, doc_id: str) -> Optional[int]:
+        row = self._db.execute("SELECT int_id FROM docs WHERE id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    # -- reads --
+
+    def get(self, include: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, List]:
+        rows = self._db.execute("SELECT id, text, metadata FROM docs ORDER BY int_id").fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows],
+        }
+
+    def _partition_ids(self, retrieval_filter: Dict[str, List[str]]) -> np.ndarray:
+        clauses, params = [], []
+        for field, allowed in retrieval_filter.items():
+            clauses.append(f"json_extract(metadata, '$.{field}') IN ({','.join('?' * len(allowed))})")
+            params.extend(allowed)
+        rows = self._db.execute(f"SELECT int_id FROM docs WHERE {' AND '.join(clauses)}", params)
+        return np.asarray([row[0] for row in rows], dtype=np.int64)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, List[str]]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        import faiss
+
+        self.refresh()
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return []
+            query = self._normalize([embedding])
+            fetch = min(k + self._tombstones, self._index.ntotal)
+            if filter:
+                # Pre-filter: the ANN search only visits ids of the partition
+                allowed = self._partition_ids(filter)
+                if not len(allowed):
+                    return []
+                scores, int_ids = self._index.search(
+                    query, fetch, params=faiss.SearchParameters(sel=faiss.IDSelectorBatch(allowed))
+                )
+            else:
+                scores, int_ids = self._index.search(query, fetch)
+            hits = [(int(i), float(s)) for i, s in zip(int_ids[0], scores[0]) if i >= 0]
+            if not hits:
+                return []
+            placeholders = ",".join("?" * len(hits))
+            rows = {
+                row[0]: row for row in self._db.execute(
+                    f"SELECT int_id, id, text, metadata FROM docs WHERE int_id IN ({placeholders})",
+                    [i for i, _ in hits],
+                )
+            }
+        results = []
+        for int_id, score in hits:
+            row = rows.get(int_id)
+            if row is None:
+                continue  # tombstone
+            results.append((Document(page_content=row[2], metadata=json.loads(row[3])), score))
+            if len(results) == k:
+                break
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_dir: str = "faiss_store", **kwargs: Any):
+        store = cls(persist_dir, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        store.persist()
+        return store
+
+
+def dense_search_kwargs(k: int, retrieval_filter: Optional[Dict[str, List[str]]] = None, backend=None) -> Dict:
+    """``as_retriever`` search kwargs with the filter in the backend's syntax."""
+    backend = backend or settings.VECTOR_STORE_BACKEND
+    search_kwargs = {"k": k}
+    if retrieval_filter:
+        search_kwargs["filter"] = to_chroma_filter(retrieval_filter) if backend == "chroma" else retrieval_filter
+    return search_kwargs
+
+
+def open_vector_store(persist_dir, embedding_model, backend=None):
+    """
+    Opens (or creates) the vector store persisted at ``persist_dir`` with the
+    configured backend.
+    """
+    backend = backend or settings.VECTOR_STORE_BACKEND
+    if backend == "faiss":
+        return FaissVectorStore(
+            persist_dir,
+            embedding_model,
+            index_type=settings.FAISS_INDEX_TYPE,
+            hnsw_m=settings.FAISS_HNSW_M,
+            mmap=settings.FAISS_MMAP,
+        )
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    from langchain.vectorstores import Chroma
+
+    return Chroma(
+        persist_directory=persist_dir,
+        embedding_function=embedding_model,
+    )
@@ -0,0 +1,57 @@
+"""
+Celery application for background jobs.
+
+Run the workers (off-peak re-indexes included) and the periodic sweeps with:
+
+    celery -A app.worker worker --concurrency=1 -Q ingestion,celery
+    celery -A app.worker worker --concurrency=4 -Q grading
+    celery -A app.worker beat
+
+Ingestion tasks write to the vector store, so one worker process per store.
+Grading workers can be scaled out freely; they claim disjoint batches.
+"""
+from celery import Celery
+
+from app.core.config import settings
+
+celery_app = Celery("eduassistant", broker=settings.REDIS_URL, backend=settings.REDIS_URL)
+celery_app.conf.update(
+    task_acks_late=True,  # a job killed mid-run is redelivered and resumes from its checkpoint
+    worker_prefetch_multiplier=1,
+    task_routes={"ingestion.*": {"queue": "ingestion"}, "grading.*": {"queue": "grading"}},
+    beat_schedule={
+        # Picks up submissions whose trigger was lost, whose grading was deferred
+        # or whose claim went stale (GRADING_CLAIM_TIMEOUT)
+        "grading-sweep": {"task": "grading.grade_pending", "schedule": settings.GRADING_SWEEP_INTERVAL},
+    },
+)
+
+
+@celery_app.task(name="ingestion.run_job")
+def run_ingestion_job(job_id: str):
+    from app.services.ingestion import IngestionJob, run_job
+    return run_job(IngestionJob(job_id))
+
+
+@celery_app.task(name="ingestion.syllabus")
+def ingest_syllabus_task(syllabus_url=None, max_lessons=None, job_id=None):
+    from app.services.ingestion import ingest_syllabus
+    return ingest_syllabus(syllabus_url, max_lessons, job_id)
+
+
+@celery_app.task(name="quiz_bank.top_up")
+def top_up_quiz_bank_task(topic, difficulty="medium", question_type="multiple_choice", jlpt_level=None, target=None):
+    """Pre-generates quiz questions off-peak, e.g. for every topic of an upcoming lesson."""
+    import asyncio
+    from app.services.rag_service import get_rag_service
+    asyncio.run(get_rag_service().top_up_quiz_bank(topic, difficulty, question_type, jlpt_level, target))
+
+
+@celery_app.task(name="grading.grade_pending")
+def grade_pending_submissions():
+    """Grades one batch of pending auto-grade submissions; re-enqueues itself while the batch is full."""
+    from app.services.grading_service import GradingService
+    result = GradingService().grade_pending()
+    if result["claimed"] >= settings.GRADING_BATCH_SIZE and result["deferred"] < result["claimed"]:
+        grade_pending_submissions.delay()
+    return result
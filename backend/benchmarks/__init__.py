@@ -0,0 +1 @@
+# Micro-benchmarks for the RAG pipeline (run with `python -m benchmarks.<name>`)
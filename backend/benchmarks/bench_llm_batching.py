@@ -0,0 +1,48 @@
+"""
+Throughput of the local LLM backend with and without dynamic batching.
+
+Sends N short prompts one after another, then all at once; concurrent
+requests are decoded together by the DynamicBatcher. Downloads
+settings.HF_MODEL_NAME on first run.
+
+Usage: python -m benchmarks.bench_llm_batching [requests] [max_new_tokens]
+"""
+import asyncio
+import sys
+import time
+
+from langchain_core.messages import HumanMessage
+
+from app.core.config import settings
+from app.services.llm_backends import DynamicBatcher, LocalChatModel, LocalGenerator
+
+
+async def run(requests, max_new_tokens):
+    generator = LocalGenerator(settings.HF_MODEL_NAME, max_new_tokens, settings.LOCAL_LLM_THREADS)
+    batcher = DynamicBatcher(generator, settings.LOCAL_LLM_MAX_BATCH, settings.LOCAL_LLM_BATCH_WAIT_MS)
+    llm = LocalChatModel(batcher=batcher, model_name=settings.HF_MODEL_NAME)
+    prompts = [[HumanMessage(f"「{word}」を使った例文を一つ書いてください。")] for word in ["食べる", "行く", "見る", "話す"] * requests][:requests]
+
+    await llm.ainvoke(prompts[0])  # load the model
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        await llm.ainvoke(prompt)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(llm.ainvoke(prompt) for prompt in prompts))
+    concurrent = time.perf_counter() - start
+
+    print(f"model:       {settings.HF_MODEL_NAME} (batch <= {settings.LOCAL_LLM_MAX_BATCH})")
+    print(f"requests:    {requests} x {max_new_tokens} new tokens")
+    print(f"sequential:  {sequential:.2f}s ({requests / sequential:.2f} req/s)")
+    print(f"batched:     {concurrent:.2f}s ({requests / concurrent:.2f} req/s)")
+    print(f"batches:     {batcher.stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+    ))
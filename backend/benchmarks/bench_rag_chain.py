@@ -0,0 +1,47 @@
+"""
+Per-query chain overhead: rebuilding the RAG chain on every query (old
+``query_rag`` behaviour) versus reusing the chain built once by
+``RAGService.get_chain``. Uses a stubbed LLM and retriever so only the
+LangChain construction/invocation cost is measured.
+
+Usage: python -m benchmarks.bench_rag_chain [num_queries]
+"""
+import sys
+import time
+
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.rag_service import init_rag
+
+
+class StubRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content=f"文法ノート {i}: {query}") for i in range(3)]
+
+
+def run(num_queries):
+    llm = FakeListChatModel(responses=["答え"])
+    retriever = StubRetriever()
+    inputs = {"input": "「は」と「が」の違いは？", "chat_history": [], "user_context": {"jlpt_level": "N4"}}
+
+    start = time.perf_counter()
+    for _ in range(num_queries):
+        init_rag(llm, retriever).invoke(inputs)
+    rebuilt = (time.perf_counter() - start) / num_queries
+
+    chain = init_rag(llm, retriever)
+    start = time.perf_counter()
+    for _ in range(num_queries):
+        chain.invoke(inputs)
+    cached = (time.perf_counter() - start) / num_queries
+
+    print(f"queries:          {num_queries}")
+    print(f"rebuild per query: {rebuilt * 1000:.2f} ms")
+    print(f"cached chain:      {cached * 1000:.2f} ms")
+    print(f"overhead saved:    {(rebuilt - cached) * 1000:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
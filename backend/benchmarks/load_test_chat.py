@@ -0,0 +1,61 @@
+"""
+Concurrency load test for the async RAG path inside a single worker.
+
+Runs N chats through the RAG chain one after another and then all at once
+with ``ainvoke``. The stub LLM waits asynchronously (like a network call to
+Gemini) and the stub retriever burns CPU (like e5 embedding + vector search)
+on the embedding pool. If nothing blocks the event loop, the concurrent run
+takes close to one chat's latency instead of N times that.
+
+Usage: python -m benchmarks.load_test_chat [concurrency] [llm_latency_s]
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.llm_backends import StubChatModel
+from app.services.query_cache import CachedRetriever, LRUCache
+from app.services.rag_service import init_rag
+
+
+class CpuRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        sum(i * i for i in range(200_000))  # stand-in for embedding the query
+        return [Document(page_content=f"文法ノート: {query}")]
+
+
+async def run(concurrency, latency):
+    retriever = CachedRetriever(
+        retriever=CpuRetriever(),
+        cache=LRUCache(0),  # no caching, every query does the work
+        version=lambda: "0",
+        k=1,
+        executor=ThreadPoolExecutor(max_workers=2),
+    )
+    chain = init_rag(StubChatModel(latency=latency), retriever)
+    inputs = [{"input": f"質問 {i}", "chat_history": []} for i in range(concurrency)]
+
+    start = time.perf_counter()
+    for item in inputs:
+        await chain.ainvoke(item)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chain.ainvoke(item) for item in inputs))
+    concurrent = time.perf_counter() - start
+
+    print(f"chats:       {concurrency} (LLM latency {latency:.2f}s)")
+    print(f"sequential:  {sequential:.2f}s")
+    print(f"concurrent:  {concurrent:.2f}s")
+    print(f"speed-up:    {sequential / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.5,
+    ))
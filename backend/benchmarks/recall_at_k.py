@@ -0,0 +1,69 @@
+"""
+Recall@k of dense, sparse (BM25) and hybrid retrieval on the bundled grammar
+corpus (data/japanese_grammar). Each passage is one blank-line separated
+block; each query lists a substring that identifies its relevant passage.
+
+Usage: python -m benchmarks.recall_at_k [k]
+"""
+import glob
+import os
+import sys
+
+from langchain.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+from app.core.config import settings
+from app.services.sparse_index import HybridRetriever, SparseIndex
+
+QUERIES = [
+    ("subject marker particle", "が (ga)"),
+    ("を の使い方", "を (wo/o)"),
+    ("に direction time", "に (ni)"),
+    ("図書館で勉強", "で (de)"),
+    ("友達と", "と (to)"),
+    ("大きい", "I-adjectives"),
+    ("きれい な形容詞", "Na-adjectives"),
+    ("読みます polite form of 読む", "U-verbs"),
+    ("食べる 一段動詞", "Ru-verbs"),
+    ("来る conjugation", "Irregular verbs"),
+]
+
+
+def load_corpus():
+    passages = []
+    for path in sorted(glob.glob(os.path.join(settings.GRAMMAR_DATA_PATH, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            blocks = [" ".join(line.strip() for line in block.splitlines()).strip()
+                      for block in f.read().split("\n\n")]
+        passages.extend(Document(page_content=b, metadata={"source": path}) for b in blocks if b)
+    return passages
+
+
+def recall(retriever, k):
+    hits = 0
+    for query, expected in QUERIES:
+        docs = retriever(query)[:k]
+        hits += any(expected in doc.page_content for doc in docs)
+    return hits / len(QUERIES)
+
+
+def run(k):
+    passages = load_corpus()
+    ids = [str(i) for i in range(len(passages))]
+    embedding = HuggingFaceEmbeddings(model_name=settings.RAG_EMBEDDING_MODEL)
+    dense = Chroma.from_documents(passages, embedding, ids=ids).as_retriever(
+        search_kwargs={"k": settings.HYBRID_CANDIDATES}
+    )
+    sparse = SparseIndex()
+    sparse.add(ids, passages)
+    hybrid = HybridRetriever(dense=dense, sparse=sparse, k=k, candidates=settings.HYBRID_CANDIDATES)
+
+    print(f"passages: {len(passages)}, queries: {len(QUERIES)}")
+    print(f"dense  recall@{k}: {recall(dense.invoke, k):.2f}")
+    print(f"sparse recall@{k}: {recall(lambda q: [d for d, _ in sparse.search(q, k)], k):.2f}")
+    print(f"hybrid recall@{k}: {recall(hybrid.invoke, k):.2f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
@@ -0,0 +1,72 @@
+"""
+Offline corpus ingestion.
+
+    python ingest.py syllabus [--max-lessons N] [--enqueue]
+    python ingest.py urls URL [URL ...] [--course-id ID] [--jlpt-level N3] [--enqueue]
+    python ingest.py resume JOB_ID [--enqueue]
+    python ingest.py status JOB_ID
+
+Runs in the foreground by default; ``--enqueue`` hands the job to the Celery
+worker instead (see app/worker.py). The API process does no ingestion work;
+it notices the new collection version within a few seconds and reopens the
+vector store and its chains (RAGService.reload_if_reindexed).
+"""
+import argparse
+import json
+import logging
+
+from app.services.ingestion import IngestionJob, ingest_syllabus, run_job, syllabus_sources
+from app.services.vector_store import partition_metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the RAG corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    syllabus = commands.add_parser("syllabus", help="Crawl and ingest the syllabus")
+    syllabus.add_argument("--url", default=None)
+    syllabus.add_argument("--max-lessons", type=int, default=None)
+    syllabus.add_argument("--enqueue", action="store_true")
+
+    urls = commands.add_parser("urls", help="Ingest documents by URL or local path")
+    urls.add_argument("urls", nargs="+")
+    urls.add_argument("--course-id", default=None)
+    urls.add_argument("--jlpt-level", default=None)
+    urls.add_argument("--enqueue", action="store_true")
+
+    resume = commands.add_parser("resume", help="Resume an interrupted job")
+    resume.add_argument("job_id")
+    resume.add_argument("--enqueue", action="store_true")
+
+    status = commands.add_parser("status", help="Show job progress")
+    status.add_argument("job_id")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.command == "status":
+        print(json.dumps(IngestionJob(args.job_id).progress(), indent=2))
+        return
+
+    if args.command == "syllabus" and not args.enqueue:
+        print(json.dumps(ingest_syllabus(args.url, args.max_lessons), indent=2))
+        return
+
+    if args.command == "resume":
+        job = IngestionJob(args.job_id)
+    elif args.command == "syllabus":
+        job = IngestionJob.create(syllabus_sources(args.url, args.max_lessons))
+    else:
+        metadata = partition_metadata(args.course_id, args.jlpt_level)
+        job = IngestionJob.create({url: {"input": url, "metadata": metadata} for url in args.urls})
+
+    if args.enqueue:
+        from app.worker import run_ingestion_job
+        run_ingestion_job.delay(job.job_id)
+        print(f"Enqueued job {job.job_id}")
+    else:
+        print(json.dumps(run_job(job), indent=2))
+
+
+if __name__ == "__main__":
+    main()
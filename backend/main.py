@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import logging
 
@@ -8,15 +9,30 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _log_warmup_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"RAG warm-up failed: {task.exception()}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up AI Educational Platform...")
     # Create database tables
     from app.db.database import engine, Base
+    import app.models.lesson_summary  # noqa: F401  registers the lesson_summaries table
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created successfully")
+    # RAG models are loaded lazily on first use; optionally warm them up in
+    # the background so startup and health checks are not delayed.
+    from app.core.config import settings
+    warmup_task = None
+    if settings.RAG_WARMUP_ON_STARTUP:
+        from app.services.rag_service import get_rag_service
+        warmup_task = asyncio.create_task(asyncio.to_thread(get_rag_service().warm_up))
+        warmup_task.add_done_callback(_log_warmup_result)
     yield
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
     # Shutdown
     logger.info("Shutting down AI Educational Platform...")
 
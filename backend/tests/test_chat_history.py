@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.chat_history import ChatHistoryStore, InMemoryHistoryBackend
+
+
+def test_summarization_runs_off_the_request_path():
+    started, release = threading.Event(), threading.Event()
+
+    def summarizer(summary, turns):
+        started.set()
+        release.wait(5)
+        return f"{len(turns)} turns"
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    store = ChatHistoryStore(InMemoryHistoryBackend(), max_turns=2, summarize_batch=1,
+                             summarizer=summarizer, executor=executor)
+    for i in range(4):
+        store.append("s", f"q{i}", f"a{i}")  # returns while the summarizer is blocked
+    assert started.wait(5)
+    release.set()
+    executor.shutdown(wait=True)
+
+    state = store.backend.load("s")
+    assert state["summary"] == "2 turns"
+    assert [turn["query"] for turn in state["turns"]] == ["q2", "q3"]
+
+
+def test_history_stays_bounded_when_summarizer_falls_behind():
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    store = ChatHistoryStore(InMemoryHistoryBackend(), max_turns=2, summarize_batch=1,
+                             summarizer=lambda summary, turns: release.wait(5) and "late", executor=executor)
+    for i in range(10):
+        store.append("s", f"q{i}", f"a{i}")
+    assert len(store.backend.load("s")["turns"]) <= 2 + 2
+    release.set()
+    executor.shutdown(wait=True)
+
+
+def test_expired_sessions_and_their_locks_are_dropped():
+    backend = InMemoryHistoryBackend(ttl=60, sweep_interval=0)
+    store = ChatHistoryStore(backend)
+    store.append("a", "q", "a")
+    backend._sessions["a"] = (0, backend._sessions["a"][1])  # expired, never loaded again
+    store.append("b", "q", "a")
+    assert backend.load("a") == {"summary": "", "turns": []}
+    assert list(backend._sessions) == ["b"]
+    assert len(store._locks) == 0
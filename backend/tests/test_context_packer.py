@@ -0,0 +1,28 @@
+from langchain_core.documents import Document
+
+from app.services.context_packer import SEPARATOR, _trim, estimate_tokens, pack_context
+
+
+def test_trim_keeps_the_separators_between_sentences():
+    text = "### 〜ながら\n- テレビを見ながら食べます。\n- Two actions at once. The subject is shared.\n- 最後の文です。"
+    trimmed = _trim(text, estimate_tokens(text) - 3)
+    assert trimmed == "### 〜ながら\n- テレビを見ながら食べます。\n- Two actions at once. The subject is shared."
+
+
+def test_trim_of_text_that_fits_is_unchanged():
+    assert _trim("短い文です。 Short.", 100) == "短い文です。 Short."
+
+
+def test_pack_context_ranks_dedups_and_respects_the_budget():
+    docs = [
+        Document(page_content="低い順位の文です。" * 3, metadata={"rerank_score": 0.1}),
+        Document(page_content="〜ながら は同時の動作を表します。", metadata={"rerank_score": 0.9}),
+        Document(page_content="〜ながら は同時の動作を表します。", metadata={"rerank_score": 0.8}),
+        Document(page_content="「て形」で動作を続けます。" * 20, metadata={"rerank_score": 0.5}),
+    ]
+    packed = pack_context(docs, max_tokens=80)
+    parts = packed.split(SEPARATOR)
+
+    assert estimate_tokens(packed) <= 80
+    assert parts[0] == "〜ながら は同時の動作を表します。"  # best first, duplicate dropped
+    assert len(parts) == 2 and parts[1].endswith("。")  # the next passage trimmed at a sentence end
@@ -0,0 +1,38 @@
+import httpx
+
+from app.services.crawler import SyllabusCrawler, confirm_validators
+
+URL = "http://fixture.test/lesson-1"
+
+
+def make_crawler(cache_dir, requests):
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text="<h1>〜ながら</h1>", headers={"ETag": '"v1"'})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    return SyllabusCrawler(str(cache_dir), min_interval=0, client=client)
+
+
+def test_deferred_validators_are_only_sent_after_confirmation(tmp_path):
+    requests = []
+    with make_crawler(tmp_path, requests) as crawler:
+        assert crawler.fetch(URL, defer_validators=True).changed
+        # Indexing failed: not confirmed, so the page is fetched in full again
+        assert crawler.fetch(URL, defer_validators=True).changed
+        assert "If-None-Match" not in requests[1].headers
+
+        confirm_validators(str(tmp_path), URL)
+        result = crawler.fetch(URL, defer_validators=True)
+    assert not result.changed
+    assert result.html == "<h1>〜ながら</h1>"
+    assert requests[2].headers["If-None-Match"] == '"v1"'
+
+
+def test_validators_are_kept_immediately_by_default(tmp_path):
+    requests = []
+    with make_crawler(tmp_path, requests) as crawler:
+        crawler.fetch(URL)
+        assert not crawler.fetch(URL).changed
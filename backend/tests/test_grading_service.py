@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+# The grading service imports the ORM models; skip where the models package is not installed
+pytest.importorskip("app.models.assignment")
+
+from app.services import grading_service
+from app.services.grading_service import GradingService
+from app.services.llm_gateway import LLMUnavailable
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def with_for_update(self, **kwargs):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.committed = False
+
+    def query(self, model):
+        return FakeQuery(self.rows)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def submission(id, claim):
+    return SimpleNamespace(id=id, max_score=10, ai_feedback={"status": "claimed", "claim": claim},
+                           score=None, is_graded=False)
+
+
+def test_grades_are_written_only_for_rows_still_claimed(monkeypatch):
+    rows = [submission(1, "ours"), submission(2, "ours"), submission(3, "another worker")]
+    session = FakeSession(rows)
+    monkeypatch.setattr(grading_service, "SessionLocal", lambda: session)
+    grade = {"score": 8.0, "feedback": "よくできました", "rubric": {}, "strengths": [], "weaknesses": []}
+    items = [{"submission_id": i} for i in (1, 2, 3)]
+
+    counts = GradingService._record(items, [grade, LLMUnavailable("busy"), grade], "ours")
+
+    assert counts == {"graded": 1, "failed": 0, "deferred": 1, "lost": 1}
+    assert session.committed
+    assert rows[0].is_graded and rows[0].ai_feedback["status"] == "graded"
+    assert rows[1].ai_feedback is None  # released back to pending
+    assert rows[2].ai_feedback == {"status": "claimed", "claim": "another worker"}
+
+
+def test_teacher_grade_saved_during_the_batch_is_kept(monkeypatch):
+    row = submission(1, "ours")
+    row.is_graded, row.score = True, 9.5  # graded by hand while the LLM batch ran
+    monkeypatch.setattr(grading_service, "SessionLocal", lambda: FakeSession([row]))
+    grade = {"score": 3.0, "feedback": "", "rubric": {}, "strengths": [], "weaknesses": []}
+
+    counts = GradingService._record([{"submission_id": 1}], [grade], "ours")
+
+    assert counts["lost"] == 1 and counts["graded"] == 0
+    assert row.score == 9.5
+
+
+def test_grading_runs_outside_the_claim_transaction(monkeypatch):
+    events = []
+
+    def claim(batch_size, token):
+        events.append("claim")
+        return [{"submission_id": 1, "max_points": 10, "jlpt_level": None}], {1: []}
+
+    async def grade_all(items, grammar):
+        events.append("grade")
+        return [RuntimeError("no JSON")]
+
+    def record(items, results, token):
+        events.append("record")
+        return {"graded": 0, "failed": 1, "deferred": 0, "lost": 0}
+
+    service = GradingService(rag_service=object())
+    monkeypatch.setattr(service, "_claim", claim)
+    monkeypatch.setattr(service, "_grade_all", grade_all)
+    monkeypatch.setattr(service, "_record", record)
+
+    result = service.grade_pending(batch_size=1)
+
+    assert events == ["claim", "grade", "record"]
+    assert result["claimed"] == 1 and result["failed"] == 1
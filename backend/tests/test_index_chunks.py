@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("faiss")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.services.ingestion_manifest import IngestionManifest
+from app.services.rag_service import index_chunks, remove_sources
+from app.services.sparse_index import SparseIndex
+from app.services.vector_store import open_vector_store
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic 8-dimensional embeddings."""
+
+    def embed_query(self, text):
+        return [float((hash(text) >> shift) & 0xFF) + 1.0 for shift in range(0, 64, 8)]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_concurrent_index_chunks_keep_every_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", "faiss")
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "flat")
+    persist_dir = str(tmp_path)
+    embeddings = HashEmbeddings()
+    sources = [f"upload:{course}/notes.md" for course in range(8)]
+
+    def ingest(source):
+        chunks = [Document(page_content=f"{source} の文法 {i}", metadata={}) for i in range(3)]
+        index_chunks(persist_dir, chunks, embeddings, source=source, metadata={"course_id": source[7]})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(ingest, sources))
+
+    manifest = IngestionManifest(persist_dir)
+    assert sorted(manifest.sources()) == sorted(sources)
+    chunk_ids = [i for source in sources for i in manifest.chunk_ids(source)]
+    assert len(chunk_ids) == 24
+    assert len(SparseIndex(persist_dir)) == 24
+    store = open_vector_store(persist_dir, embeddings)
+    assert sorted(store.get()["ids"]) == sorted(chunk_ids)
+    assert store._index.ntotal == 24
+
+
+def test_chunks_without_a_source_record_no_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", "faiss")
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "flat")
+    persist_dir = str(tmp_path)
+
+    index_chunks(persist_dir, [], HashEmbeddings())
+    index_chunks(persist_dir, [Document(page_content="は と が", metadata={})], HashEmbeddings())
+
+    assert IngestionManifest(persist_dir).sources() == []
+    assert len(SparseIndex(persist_dir)) == 0
+
+
+def test_removed_sources_leave_no_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", "faiss")
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "flat")
+    persist_dir = str(tmp_path)
+    embeddings = HashEmbeddings()
+    for source in ("lesson-1", "lesson-2"):
+        chunks = [Document(page_content=f"{source} {i}", metadata={}) for i in range(3)]
+        index_chunks(persist_dir, chunks, embeddings, source=source)
+
+    assert remove_sources(persist_dir, embeddings, ["lesson-1", "never-indexed"]) == 3
+
+    manifest = IngestionManifest(persist_dir)
+    assert manifest.sources() == ["lesson-2"]
+    assert len(SparseIndex(persist_dir)) == 3
+    assert sorted(open_vector_store(persist_dir, embeddings).get()["ids"]) == sorted(manifest.chunk_ids("lesson-2"))
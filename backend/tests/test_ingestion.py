@@ -0,0 +1,44 @@
+import base64
+import os
+
+import pytest
+
+from app.services.ingestion import IngestionJob, create_upload_job, dropped_syllabus_sources
+from app.services.ingestion_manifest import IngestionManifest
+from app.services.rag_service import chunk_tags
+from app.services.vector_store import partition_metadata
+
+
+def test_upload_job_records_its_owner(tmp_path):
+    documents = [
+        {"filename": "notes.md", "content": "# ながら", "document_type": "markdown"},
+        {"filename": "drill.pdf", "content": base64.b64encode(b"%PDF-1.4").decode(), "document_type": "pdf"},
+    ]
+    job = create_upload_job(documents, 7, str(tmp_path), user_id=3)
+
+    reloaded = IngestionJob(job.job_id, str(tmp_path))
+    assert reloaded.owner == {"user_id": 3, "course_id": 7}
+    assert sorted(reloaded.sources) == ["upload:7/drill.pdf", "upload:7/notes.md"]
+
+
+def test_invalid_base64_is_rejected_before_anything_is_written(tmp_path):
+    documents = [
+        {"filename": "notes.md", "content": "# ながら", "document_type": "markdown"},
+        {"filename": "drill.pdf", "content": "not base64!", "document_type": "pdf"},
+    ]
+    with pytest.raises(ValueError, match="drill.pdf"):
+        create_upload_job(documents, 7, str(tmp_path), user_id=3)
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_unlisted_syllabus_pages_are_dropped(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    site = "https://wasabi-jpn.com/japanese-grammar"
+    for source in (f"{site}/nagara", f"{site}/removed"):
+        manifest.record(source, "h", {}, chunk_tags(source, partition_metadata()))
+    manifest.record(f"{site}/course-page", "h", {}, chunk_tags(f"{site}/course-page", partition_metadata(3)))
+    manifest.record("upload:3/notes.md", "h", {}, chunk_tags("upload:3/notes.md", partition_metadata(3)))
+    manifest.record("https://example.com/other", "h", {}, chunk_tags("https://example.com/other", partition_metadata()))
+
+    dropped = dropped_syllabus_sources(manifest, f"{site}/index", [f"{site}/nagara"])
+    assert dropped == [f"{site}/removed"]
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.llm_backends import DynamicBatcher
+
+
+def test_batcher_survives_cancelled_callers():
+    started, release = threading.Event(), threading.Event()
+
+    def run(items):
+        started.set()
+        release.wait(5)
+        return [item.upper() for item in items]
+
+    batcher = DynamicBatcher(run, max_batch_size=4, max_wait_ms=1)
+
+    async def cancelled_caller():
+        task = asyncio.ensure_future(asyncio.wrap_future(batcher.submit("a")))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # One caller gives up while its batch is decoding, one before it was picked up
+    first = batcher.submit("x")
+    assert started.wait(5)
+    asyncio.run(cancelled_caller())
+    first.cancel()
+    release.set()
+
+    assert batcher.submit("b").result(timeout=5) == "B"
+    assert batcher._thread.is_alive()
+
+
+def test_batcher_delivers_batch_errors_and_keeps_running():
+    calls = []
+
+    def run(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise ValueError("model failed")
+        return items
+
+    batcher = DynamicBatcher(run, max_batch_size=2, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("a").result(timeout=5)
+    assert batcher.submit("b").result(timeout=5) == "b"
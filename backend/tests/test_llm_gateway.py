@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_gateway import LLMGateway, LLMUnavailable
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_cancelled_follower_does_not_fail_leader():
+    gateway = LLMGateway(max_concurrency=2)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_call():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(gateway.acoalesced_call("key", slow_call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(gateway.acoalesced_call("key", slow_call))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        release.set()
+        return await leader
+
+    assert asyncio.run(scenario()) == "answer"
+    assert gateway.counters["coalesced"] == 1
+    assert gateway.limiter.active == 0
+
+
+def test_followers_share_the_leader_result():
+    gateway = LLMGateway(max_concurrency=2)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def scenario():
+        return await asyncio.gather(*(gateway.acoalesced_call("key", call) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["answer"] * 5
+    assert len(calls) == 1
+
+
+def test_exhausted_rate_limit_retries_count_once_towards_breaker():
+    gateway = LLMGateway(max_retries=2, backoff_base=0, breaker_threshold=5)
+
+    def call():
+        raise RateLimited("429 Too Many Requests")
+
+    with pytest.raises(LLMUnavailable):
+        gateway.call(call)
+    assert gateway.breaker.failures == 1
+    assert gateway.counters["failures"] == 1
+    assert gateway.counters["rate_limited"] == 3
+
+
+def test_breaker_opens_and_fails_fast():
+    gateway = LLMGateway(breaker_threshold=2, breaker_cooldown=60)
+
+    def call():
+        raise ValueError("boom")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            gateway.call(call)
+    with pytest.raises(LLMUnavailable):
+        gateway.call(lambda: "never called")
+    assert gateway.breaker.state == "open"
@@ -0,0 +1,12 @@
+from app.services.quiz_bank import QuizBank
+
+
+def test_take_non_positive_returns_nothing(tmp_path):
+    bank = QuizBank(str(tmp_path / "bank.sqlite3"))
+    questions = [{"question": f"Q{i}", "options": ["a", "b"]} for i in range(3)]
+    bank.add("ながら|N5|medium|multiple_choice", questions, [[float(i == j) for j in range(3)] for i in range(3)])
+
+    assert bank.take("ながら|N5|medium|multiple_choice", -1) == []
+    assert bank.take("ながら|N5|medium|multiple_choice", 0) == []
+    assert bank.stats["served"] == 0
+    assert len(bank.take("ながら|N5|medium|multiple_choice", 2)) == 2
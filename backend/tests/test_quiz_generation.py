@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.quiz_bank import QuizBank, quiz_bucket
+from app.services.rag_service import RAGService
+
+
+class OneHotEmbeddings:
+    """Same text, same vector; different texts are orthogonal."""
+
+    def __init__(self):
+        self.seen = {}
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            index = self.seen.setdefault(text, len(self.seen))
+            vectors.append([float(index == i) for i in range(32)])
+        return vectors
+
+
+def question(text):
+    return {"question": text, "options": ["a", "b", "c", "d"], "answer": "a"}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "QUIZ_GENERATION_BATCH", 2)
+    service = RAGService(persist_dir=str(tmp_path / "store"))
+    service._quiz_bank = QuizBank(str(tmp_path / "bank.sqlite3"))
+    service._embedding_model = OneHotEmbeddings()
+    service.retrievals = 0
+
+    async def retrieve(topic, jlpt_level, k):
+        service.retrievals += 1
+        return [Document(page_content=f"passage {i}") for i in range(k)]
+
+    service._retrieve_quiz_material = retrieve
+    service._schedule_quiz_top_up = lambda *args: None
+    return service
+
+
+def collect(service, **kwargs):
+    async def run():
+        events = [item async for item in service.stream_quiz("ながら", jlpt_level="N5", **kwargs)]
+        return [data for event, data in events if event == "question"], events[-1][1]
+    return asyncio.run(run())
+
+
+def test_duplicate_and_empty_parts_are_retried(service):
+    replies = iter([
+        [question("A"), question("A")],  # the second is a near-duplicate of the first
+        [],  # a short reply
+        [question("B"), question("C")],
+    ])
+    calls = []
+
+    async def generate(topic, difficulty, question_type, jlpt_level, num_questions, docs=None, part=1):
+        calls.append(num_questions)
+        reply = next(replies)
+        await asyncio.sleep(0.01 if reply else 0)  # the empty part finishes first
+        return reply
+
+    service._generate_quiz_questions = generate
+    questions, summary = collect(service, num_questions=3)
+
+    assert [q["question"] for q in questions] == ["A", "B", "C"]
+    assert calls == [2, 1, 2]
+    assert summary["complete"] and summary["num_questions"] == 3
+
+
+def test_calls_running_at_the_deadline_are_cancelled(service):
+    cancelled = []
+
+    async def generate(topic, difficulty, question_type, jlpt_level, num_questions, docs=None, part=1):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(part)
+            raise
+        return []
+
+    service._generate_quiz_questions = generate
+    questions, summary = collect(service, num_questions=3, timeout=0.05)
+
+    assert questions == []
+    assert not summary["complete"]
+    assert sorted(cancelled) == [1, 2]
+
+
+def test_bank_hits_skip_retrieval_and_generation(service):
+    async def generate(*args, **kwargs):
+        raise AssertionError("the bank had enough questions")
+
+    service._generate_quiz_questions = generate
+    bucket = quiz_bucket("ながら", "N5", "medium", "multiple_choice")
+    service.quiz_bank.add(bucket, [question(q) for q in "XYZ"], service.embedding_model.embed_documents(list("XYZ")))
+
+    questions, summary = collect(service, num_questions=2)
+
+    assert len(questions) == 2
+    assert summary["from_bank"] == 2 and summary["complete"]
+    assert service.retrievals == 0
+
+
+def test_question_count_is_clamped(service, monkeypatch):
+    monkeypatch.setattr(settings, "QUIZ_MAX_QUESTIONS", 2)
+    bucket = quiz_bucket("ながら", "N5", "medium", "multiple_choice")
+    service.quiz_bank.add(bucket, [question(q) for q in "XYZ"], service.embedding_model.embed_documents(list("XYZ")))
+
+    assert collect(service, num_questions=-1)[0] == []
+    assert len(collect(service, num_questions=1000)[0]) == 2
+    assert service.retrievals == 0
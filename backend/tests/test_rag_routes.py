@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+# The routes import the ORM models; skip where the models package is not installed
+pytest.importorskip("app.models.user")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import rag
+from app.core.security import get_current_user
+
+
+from app.services.llm_gateway import LLMUnavailable
+
+
+class FakeRAGService:
+    async def generate_response(self, query, user_context, course_id=None, conversation_history=None, session_id=None):
+        return {"response": f"answer to {query}", "sources": [], "confidence": 0.5}
+
+    async def generate_lesson_summary(self, content, target_level="intermediate", jlpt_level=None):
+        raise LLMUnavailable("LLM queue is full")
+
+
+def make_client(monkeypatch, role):
+    monkeypatch.setattr(rag, "rag_service", FakeRAGService())
+    monkeypatch.setattr(rag, "save_chat_message", lambda user_id, chat_request, response_data: 42)
+    app = FastAPI()
+    app.include_router(rag.router, prefix="/api/rag")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(
+        id=1, jlpt_level="N5", learning_preferences={}, role=SimpleNamespace(value=role)
+    )
+    return TestClient(app)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    return make_client(monkeypatch, "student")
+
+
+def test_chat_returns_the_answer(client):
+    response = client.post("/api/rag/chat", json={"message": "は and が", "session_id": "s1"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["message_id"] == 42
+    assert body["response"] == "answer to は and が"
+    assert body["sources"] == []
+
+
+def test_lesson_summary_maps_llm_overload_to_503(monkeypatch):
+    client = make_client(monkeypatch, "teacher")
+    monkeypatch.setattr(rag, "get_cached_summary", lambda key: None)
+    monkeypatch.setattr(rag, "summary_key", lambda content, target_level, jlpt_level: {"cache_key": "k"})
+    response = client.post("/api/rag/generate-lesson-summary", params={"lesson_content": "〜ながら"})
+    assert response.status_code == 503
+
+
+@pytest.mark.parametrize("path", ["/api/rag/generate-quiz", "/api/rag/generate-quiz/stream"])
+@pytest.mark.parametrize("num_questions", [-1, 0, 10_000])
+def test_quiz_size_is_bounded(monkeypatch, path, num_questions):
+    client = make_client(monkeypatch, "teacher")
+    response = client.post(path, params={"topic": "ながら", "num_questions": num_questions})
+    assert response.status_code == 422
+
+
+def test_upload_progress_is_hidden_from_other_users(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag.settings, "INGESTION_WORK_DIR", str(tmp_path))
+    job = rag.IngestionJob.create({}, owner={"user_id": 2, "course_id": 7})
+    client = make_client(monkeypatch, "student")
+    client.app.dependency_overrides[rag.get_db] = lambda: SimpleNamespace(
+        query=lambda model: SimpleNamespace(filter=lambda *args: SimpleNamespace(first=lambda: None))
+    )
+    assert client.get(f"/api/rag/upload-documents/{job.job_id}").status_code == 404
+
+
+def test_invalid_base64_upload_is_a_bad_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag.settings, "INGESTION_WORK_DIR", str(tmp_path))
+    client = make_client(monkeypatch, "teacher")
+    course = SimpleNamespace(teacher_id=1)
+    client.app.dependency_overrides[rag.get_db] = lambda: SimpleNamespace(
+        query=lambda model: SimpleNamespace(filter=lambda *args: SimpleNamespace(first=lambda: course))
+    )
+    response = client.post(
+        "/api/rag/upload-documents", params={"course_id": 7},
+        json=[{"filename": "drill.pdf", "content": "not base64!", "document_type": "pdf"}],
+    )
+    assert response.status_code == 400
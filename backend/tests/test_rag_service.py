@@ -0,0 +1,70 @@
+from app.services import rag_service as rag_module
+from app.services.ingestion_manifest import IngestionManifest
+from app.services.rag_service import RAGService, parse_quiz_questions
+
+
+def test_reindex_by_another_process_reopens_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_module, "RELOAD_CHECK_INTERVAL", 0)
+    service = RAGService(persist_dir=str(tmp_path))
+    service.reload_if_reindexed()
+    service._vector_db, service._chains = object(), {"chain": object()}
+
+    service.reload_if_reindexed()
+    assert service._vector_db is not None and service._chains
+
+    IngestionManifest(str(tmp_path)).save()  # what index_chunks does after writing
+    service.reload_if_reindexed()
+    assert service._vector_db is None and not service._chains
+
+
+def test_truncated_quiz_reply_keeps_complete_questions():
+    reply = (
+        '```json\n[{"question": "「食べながら」の意味は？", "options": ["while eating", "after eating"], '
+        '"answer": "while eating", "explanation": "〜ながら は同時の動作"},\n'
+        ' {"question": "「行けば」の形は？", "answer": "ば形"},\n'
+        ' {"question": "「見たら」の意味は？", "options": ["if I see", "'
+    )
+    questions = parse_quiz_questions(reply, "multiple_choice")
+    assert [q["answer"] for q in questions] == ["while eating", "ば形"]
+    assert all(q["type"] == "multiple_choice" for q in questions)
+
+
+def test_quiz_reply_without_questions_parses_to_nothing():
+    assert parse_quiz_questions("すみません、問題を作れませんでした。", "short_answer") == []
+
+
+def test_chunks_end_on_japanese_sentence_boundaries(tmp_path):
+    from app.services.rag_service import chunk_document
+
+    path = tmp_path / "lesson.md"
+    path.write_text("### 〜ながら\n" + "テレビを見ながらご飯を食べます。" * 12 + "本当ですか？" * 4, encoding="utf-8")
+    chunks = chunk_document(str(path), chunk_size=60, chunk_overlap=0)
+    assert len(chunks) > 1
+    assert all(chunk.page_content[-1] in "。！？" for chunk in chunks)
+    assert not any(chunk.page_content[0] in "。！？" for chunk in chunks)
+
+
+def test_constructing_the_service_touches_no_storage(tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    bank_path = tmp_path / "quiz_bank.sqlite3"
+    monkeypatch.setattr(settings, "QUIZ_BANK_PATH", str(bank_path))
+    service = RAGService(persist_dir=str(tmp_path / "store"))
+    assert not bank_path.exists()
+    assert service.quiz_bank.count("any") == 0
+    assert bank_path.exists()
+
+
+def test_docling_failures_carry_its_stderr(tmp_path, monkeypatch):
+    import os
+    from app.services.rag_service import parse_documents
+
+    fake = tmp_path / "bin" / "docling"
+    fake.parent.mkdir()
+    fake.write_text("#!/bin/sh\necho 'Out of memory loading granite_docling' >&2\nexit 1\n")
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{fake.parent}{os.pathsep}{os.environ['PATH']}")
+
+    converted, failed = parse_documents(["lesson.pdf"], str(tmp_path / "out"), retries=0)
+    assert converted == {}
+    assert "Out of memory loading granite_docling" in str(failed["lesson.pdf"])
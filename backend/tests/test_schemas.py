@@ -0,0 +1,12 @@
+from datetime import datetime
+
+from app.schemas.assignment import AssignmentSubmissionResponse
+
+
+def test_submission_response_hides_the_grading_claim():
+    response = AssignmentSubmissionResponse(
+        id=1, assignment_id=2, student_id=3, content="食べます", max_score=10, is_graded=False,
+        ai_feedback={"status": "claimed", "claim": "0f3a", "claimed_at": "2026-10-16T00:00:00+00:00"},
+        attempt_number=1, is_late=False, submitted_at=datetime(2026, 10, 16),
+    )
+    assert response.ai_feedback == {"status": "claimed", "claimed_at": "2026-10-16T00:00:00+00:00"}
@@ -0,0 +1,37 @@
+import asyncio
+
+from app.services import rag_service as rag_module
+from app.services.rag_service import RAGService
+from app.services.semantic_cache import SemanticResponseCache
+
+
+def test_lookup_matches_close_questions_within_a_partition_only():
+    cache = SemanticResponseCache(threshold=0.95)
+    cache.store("student", [1.0, 0.0], {"response": "は marks the topic"})
+    assert cache.lookup("student", [0.99, 0.01])["response"] == "は marks the topic"
+    assert cache.lookup("teacher", [1.0, 0.0]) is None
+    assert cache.lookup("student", [0.0, 1.0]) is None
+
+
+def test_learner_profiles_do_not_share_cached_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_module.settings, "SEMANTIC_CACHE_ENABLED", True)
+    service = RAGService(persist_dir=str(tmp_path))
+
+    async def embed(text):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(service, "aembed_query", embed)
+    student = {"jlpt_level": "N5", "role": "student", "learning_preferences": {"romaji": True}}
+    teacher = dict(student, role="teacher")
+
+    async def scenario():
+        key, cached = await service._cache_lookup("は vs が", student, 1, [])
+        assert cached is None
+        service._cache_store(key, {"response": "student answer"})
+        _, for_student = await service._cache_lookup("は vs が", dict(student), 1, [])
+        _, for_teacher = await service._cache_lookup("は vs が", teacher, 1, [])
+        return for_student, for_teacher
+
+    for_student, for_teacher = asyncio.run(scenario())
+    assert for_student["response"] == "student answer"
+    assert for_teacher is None
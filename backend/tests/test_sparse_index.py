@@ -0,0 +1,79 @@
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.sparse_index import HybridRetriever, SparseIndex, reciprocal_rank_fusion, tokenize
+from app.services.vector_store import partition_filter, partition_metadata
+
+
+def doc(text, course_id=None, jlpt_level=None):
+    return Document(page_content=text, metadata=partition_metadata(course_id, jlpt_level))
+
+
+class ListRetriever(BaseRetriever):
+    docs: list
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.docs
+
+
+def test_tokenize_uses_bigrams_for_japanese_and_words_for_latin():
+    assert tokenize("見ながら") == ["見な", "なが", "がら"]
+    assert tokenize("〜ば Conditional ＡＢ") == ["conditional", "ab", "〜ば"]
+    assert tokenize("は") == ["は"]
+
+
+def test_bm25_ranks_the_matching_grammar_pattern_first():
+    index = SparseIndex()
+    index.add(["a", "b", "c"], [
+        doc("テレビを見ながらご飯を食べます。"),
+        doc("雨が降れば、行きません。"),
+        doc("音楽を聞きながら勉強します。勉強しながら歌います。"),
+    ])
+    results = index.search("ながら", k=3)
+
+    assert [d.page_content for d, _ in results] == [
+        "音楽を聞きながら勉強します。勉強しながら歌います。",  # higher term frequency
+        "テレビを見ながらご飯を食べます。",
+    ]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_search_is_restricted_to_the_partition():
+    index = SparseIndex()
+    index.add(["shared", "own", "other", "hard"], [
+        doc("〜ながら shared"),
+        doc("〜ながら course 1", course_id=1, jlpt_level="N5"),
+        doc("〜ながら course 2", course_id=2),
+        doc("〜ながら N1", jlpt_level="N1"),
+    ])
+
+    course_1 = partition_filter(1, "N4", by_jlpt=True)
+    assert course_1 == {"course_id": ["global", "1"], "jlpt_level": ["N5", "N4", "any"]}
+    found = {d.page_content for d, _ in index.search("ながら", k=10, filter=course_1)}
+    assert found == {"〜ながら shared", "〜ながら course 1"}
+
+
+def test_deleted_chunks_are_not_found_after_reload(tmp_path):
+    index = SparseIndex(str(tmp_path))
+    index.add(["a", "b"], [doc("見ながら"), doc("食べながら")])
+    index.delete(["a"])
+    index.save()
+
+    reloaded = SparseIndex(str(tmp_path))
+    assert len(reloaded) == 1
+    assert [d.page_content for d, _ in reloaded.search("ながら")] == ["食べながら"]
+
+
+def test_reciprocal_rank_fusion_favours_documents_in_both_rankings():
+    a, b, c, d = (Document(page_content=text) for text in "abcd")
+    fused = reciprocal_rank_fusion([[a, b, c], [Document(page_content="a"), d, c]], k=3)  # same content, same document
+    assert [x.page_content for x in fused] == ["a", "c", "b"]
+
+
+def test_hybrid_retriever_fuses_dense_and_sparse_results():
+    sparse = SparseIndex()
+    sparse.add(["x", "y"], [doc("〜ながら sparse only"), doc("〜ながら in both")])
+    dense = ListRetriever(docs=[doc("dense only"), doc("〜ながら in both")])
+    retriever = HybridRetriever(dense=dense, sparse=sparse, k=2, candidates=5)
+
+    assert [d.page_content for d in retriever.invoke("ながら")][0] == "〜ながら in both"
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("faiss")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.services.rag_service import index_chunks
+from app.services.vector_store import FaissVectorStore, open_vector_store
+
+
+class HashEmbeddings(Embeddings):
+    def embed_query(self, text):
+        return [float((hash(text) >> shift) & 0xFF) + 1.0 for shift in range(0, 64, 8)]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_reingestion_compacts_hnsw_tombstones(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_BACKEND", "faiss")
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "hnsw")
+    persist_dir = str(tmp_path)
+    embeddings = HashEmbeddings()
+
+    for version in range(3):
+        chunks = [Document(page_content=f"第{version}版 {i}", metadata={}) for i in range(4)]
+        index_chunks(persist_dir, chunks, embeddings, source="lesson-1")
+
+    store = open_vector_store(persist_dir, embeddings)
+    assert store._index.ntotal == 4
+    assert store.tombstone_ratio == 0.0
+
+
+def test_hnsw_delete_leaves_tombstones_until_compact(tmp_path):
+    store = FaissVectorStore(str(tmp_path), HashEmbeddings(), index_type="hnsw")
+    store.add_documents([Document(page_content=f"文 {i}") for i in range(4)], ids=["a", "b", "c", "d"])
+    store.delete(ids=["a", "b"])
+    assert store.tombstone_ratio == 0.5
+    assert {doc.page_content for doc in store.similarity_search("文 2", k=4)} == {"文 2", "文 3"}
+    store.compact()
+    assert store._index.ntotal == 2 and store.tombstone_ratio == 0.0